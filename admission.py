@@ -0,0 +1,137 @@
+import os
+import math
+import time
+import asyncio
+import functools
+
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
+
+class InferenceBusy(Exception):
+    """
+    raised when the gate is at capacity;
+    handler in main.py turns it into a 503 + Retry-After."""
+
+    def __init__(self, reason: str, retryAfter: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retryAfter = retryAfter
+
+class InferenceGate:
+    """
+    concurrency limit + bounded wait queue for cpu bound routes.
+    - up to maxActive requests run at once
+    - up to maxQueue more wait (at most queueTimeout seconds)
+    - anything past that fails fast instead of piling up"""
+
+    def __init__(self, maxActive: int, maxQueue: int, queueTimeout: float, retryAfter: int):
+        self.maxActive = max(1, maxActive)
+        self.maxQueue = max(0, maxQueue)
+        self.queueTimeout = queueTimeout
+        self.retryAfter = retryAfter
+
+        self._sem = asyncio.Semaphore(self.maxActive)
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timedOut = 0
+        self.peakWaiting = 0
+
+        # >> ewma of time spent holding a slot; used for the Retry-After estimate <<
+        self._avgServiceSec = 0.0
+
+    def retryAfterGet(self) -> int:
+        est = self._avgServiceSec * (self.waiting + 1) / self.maxActive
+        return max(self.retryAfter, int(math.ceil(est)))
+
+    async def acquire(self) -> float:
+        """
+        wait for a slot; returns the start time to hand back to release()"""
+
+        if self._sem.locked():
+            if self.waiting >= self.maxQueue:
+                self.rejected += 1
+                raise InferenceBusy("Inference queue is full.", self.retryAfterGet())
+
+            self.waiting += 1
+            self.peakWaiting = max(self.peakWaiting, self.waiting)
+
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self.queueTimeout)
+            except asyncio.TimeoutError:
+                self.timedOut += 1
+                self.rejected += 1
+                raise InferenceBusy("Timed out waiting for an inference slot.", self.retryAfterGet())
+            finally:
+                self.waiting -= 1
+        else:
+            await self._sem.acquire()
+
+        self.active += 1
+        self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, started: float) -> None:
+        took = time.perf_counter() - started
+        self._avgServiceSec = took if self._avgServiceSec == 0 else (0.8 * self._avgServiceSec + 0.2 * took)
+
+        self.active -= 1
+        self._sem.release()
+
+    def capacityCheck(self) -> None:
+        """
+        fail fast without taking a slot; for streamed routes that
+        take slots per chunk later on."""
+
+        if self._sem.locked() and self.waiting >= self.maxQueue:
+            self.rejected += 1
+            raise InferenceBusy("Inference queue is full.", self.retryAfterGet())
+
+    @asynccontextmanager
+    async def slot(self):
+        started = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def gated(self, fn):
+        """
+        decorator for route handlers. sync handlers run in the threadpool
+        while holding the slot so the event loop stays free."""
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = await self.acquire()
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    return await fn(*args, **kwargs)
+                return await run_in_threadpool(fn, *args, **kwargs)
+            finally:
+                self.release(started)
+
+        return wrapper
+
+    def stats(self) -> dict:
+        return {
+            "max_active": self.maxActive,
+            "max_queue": self.maxQueue,
+            "queue_timeout": self.queueTimeout,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peakWaiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timedOut,
+            "avg_service_sec": round(self._avgServiceSec, 4),
+        }
+
+# >> one gate per process, shared by every clip backed route. <<
+inferenceGate = InferenceGate(
+    maxActive = int(os.getenv("INFER_MAX_ACTIVE", "2")),
+    maxQueue = int(os.getenv("INFER_MAX_QUEUE", "8")),
+    queueTimeout = float(os.getenv("INFER_QUEUE_TIMEOUT", "10")),
+    retryAfter = int(os.getenv("INFER_RETRY_AFTER", "2")),
+)
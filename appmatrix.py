@@ -0,0 +1,144 @@
+import numpy as np
+
+from collections import Counter
+from db import all_fetch, single_fetch, timestamp
+from rec import scoreReasonsGet
+from cooc import coocBlend, coocReasonGet
+
+# >>> catalogue wide app x genre / app x category matrix built from app_index
+# + the normalised app_genres / app_categories tables.
+# kept sparse as posting arrays (CSR style): for app i its genre ids are
+# gFeat[gIndptr[i]:gIndptr[i + 1]], in steam's listing order. <<<
+
+_appMatrix: dict | None = None
+
+def _appMatrixStamp() -> tuple:
+    row = single_fetch("SELECT COUNT(*) AS count, MAX(updated_at) AS updated_at FROM app_index")
+    return (row["count"], row["updated_at"]) if row else (0, None)
+
+def _postingsGet(appids: np.ndarray, table: str, vocabTable: str, idCol: str) -> tuple[list, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    read one label table as postings.
+    returns (vocab indexed by label id, indptr, label ids, row ids)"""
+
+    vocabRows = all_fetch(f"SELECT {idCol} AS id, name FROM {vocabTable}")
+    vocab = [None] * (max((int(r["id"]) for r in vocabRows), default = 0) + 1)
+
+    for r in vocabRows:
+        vocab[int(r["id"])] = r["name"]
+
+    rows = all_fetch(f"SELECT appid, {idCol} AS id FROM {table} ORDER BY appid, pos")
+    postAppids = np.array([int(r["appid"]) for r in rows], dtype=np.int64)
+    feat = np.array([int(r["id"]) for r in rows], dtype=np.int64)
+
+    # >> labels for apps missing from app_index are dropped <<
+    keep = np.isin(postAppids, appids)
+    postAppids, feat = postAppids[keep], feat[keep]
+
+    rowIds = np.searchsorted(appids, postAppids)
+    indptr = np.searchsorted(rowIds, np.arange(len(appids) + 1))
+
+    return vocab, indptr, feat, rowIds
+
+def appMatrixGet() -> dict:
+    """
+    load (or reuse) the catalogue matrix; rebuilt when app_index changes.
+    updated_at is whole seconds, so a matrix loaded while its newest write was
+    still in the current second is never reused (same check as _appMetaValidate)"""
+
+    global _appMatrix
+
+    stamp = _appMatrixStamp()
+    if _appMatrix is not None and _appMatrix["stamp"] == stamp and _appMatrix["closed"]:
+        return _appMatrix
+
+    closed = stamp[1] is None or timestamp() > stamp[1]
+
+    rows = all_fetch("SELECT appid, name FROM app_index ORDER BY appid")
+    appids = np.array([int(r["appid"]) for r in rows], dtype=np.int64)
+
+    genreVocab, gIndptr, gFeat, gRows = _postingsGet(appids, "app_genres", "genre_vocab", "genre_id")
+    catVocab, cIndptr, cFeat, cRows = _postingsGet(appids, "app_categories", "category_vocab", "category_id")
+
+    _appMatrix = {
+        "appids": appids,
+        "names": [r["name"] for r in rows],
+        "genreVocab": genreVocab,
+        "gIndptr": gIndptr,
+        "gFeat": gFeat,
+        "gRows": gRows,
+        "catVocab": catVocab,
+        "cIndptr": cIndptr,
+        "cFeat": cFeat,
+        "cRows": cRows,
+        "stamp": stamp,
+        "closed": closed,
+    }
+    return _appMatrix
+
+def profileVecGet(profile: Counter, vocab: list[str]) -> np.ndarray:
+    return np.array([float(profile.get(v, 0)) if v is not None else 0.0 for v in vocab], dtype=np.float64)
+
+def catalogScores(genreProfile: Counter, catProfile: Counter, catWeight: float = 0.35) -> np.ndarray:
+    """
+    GameScoring for every app at once.
+    score = app x genre @ genre profile + catWeight * app x category @ category profile"""
+
+    M = appMatrixGet()
+    n = len(M["appids"])
+
+    gVec = profileVecGet(genreProfile, M["genreVocab"])
+    cVec = profileVecGet(catProfile, M["catVocab"])
+
+    genreScore = np.bincount(M["gRows"], weights=gVec[M["gFeat"]], minlength=n)
+    catScore = np.bincount(M["cRows"], weights=cVec[M["cFeat"]], minlength=n)
+
+    return genreScore + catWeight * catScore
+
+def appLabelsGet(M: dict, i: int) -> tuple[list[str], list[str]]:
+    """
+    genre / category names for row i of the matrix"""
+
+    genres = [M["genreVocab"][f] for f in M["gFeat"][M["gIndptr"][i]:M["gIndptr"][i + 1]]]
+    cats = [M["catVocab"][f] for f in M["cFeat"][M["cIndptr"][i]:M["cIndptr"][i + 1]]]
+    return genres, cats
+
+def topRecsGet(genreProfile: Counter, catProfile: Counter, exclude: set[int] | None = None, k: int = 20, cf: dict | None = None) -> list[dict]:
+    """
+    top k apps across the whole catalogue.
+    cf -> optional co-ownership scores (cooc.coocScoresGet) blended in.
+    reasons are only built for the returned apps"""
+
+    M = appMatrixGet()
+    scores = catalogScores(genreProfile, catProfile)
+
+    if exclude:
+        scores[np.isin(M["appids"], np.fromiter(exclude, dtype=np.int64))] = -np.inf
+
+    if cf:
+        coocBlend(scores, M["appids"], cf)
+
+    valid = int(np.isfinite(scores).sum())
+    k = min(k, valid)
+    if k <= 0:
+        return []
+
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.lexsort((top, -scores[top]))]
+
+    results = []
+
+    for i in top:
+        genres, cats = appLabelsGet(M, int(i))
+        reasons = scoreReasonsGet(genres, cats, genreProfile, catProfile)
+
+        if cf and int(M["appids"][i]) in cf:
+            reasons.append(coocReasonGet(cf, int(M["appids"][i])))
+
+        results.append({
+            "appid": int(M["appids"][i]),
+            "Score": float(scores[i]),
+            "Reasons": reasons,
+        })
+
+    return results
@@ -0,0 +1,158 @@
+import os
+import json
+import threading
+
+from collections import OrderedDict
+from db import all_fetch, single_fetch, timestamp
+
+# >>> bulk app metadata.
+# read-through LRU of app_index keyed by appid; misses for a whole list are
+# resolved with one IN (...) query. apps not in app_index arent cached, so
+# they show up as soon as anything indexes them.
+# validated against MAX(app_index.updated_at) on every call: when it moves,
+# entries for apps updated since the last check are dropped, so writes from
+# other workers / catalog.py are picked up too. UpsertAppIndex also calls
+# appMetaInvalidate for the app it writes. <<<
+
+APPMETA_CACHE_SIZE = int(os.getenv("APPMETA_CACHE_SIZE", "20000"))
+
+_appMeta: OrderedDict[int, dict] = OrderedDict()
+_appMetaLock = threading.Lock()
+_appMetaGen = 0
+
+# >> (MAX(updated_at) last seen, whether that second had already passed) <<
+_appMetaStamp: tuple[int | None, bool] = (None, False)
+
+# >> stays under sqlite's bound parameter limit <<
+_IN_CHUNK = 500
+
+def _chunks(values: list, size: int = _IN_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _appMetaValidate() -> None:
+    """
+    drop entries for apps app_index has updated since the last call.
+    timestamps are whole seconds, so while the newest write is still in the
+    current second the check is repeated on the next call"""
+
+    global _appMetaStamp
+
+    row = single_fetch("SELECT MAX(updated_at) AS updated_at FROM app_index")
+    cur = row["updated_at"] if row else None
+    seen, closed = _appMetaStamp
+
+    if cur == seen and closed:
+        return
+
+    if seen is None:
+        stale = None
+    else:
+        stale = [int(r["appid"]) for r in all_fetch("SELECT appid FROM app_index WHERE updated_at >= ?", (seen,))]
+
+    appMetaInvalidate(stale)
+    _appMetaStamp = (cur, cur is None or timestamp() > cur)
+
+def appMetaGet(appids: list[int]) -> dict[int, dict]:
+    """
+    appid -> {"appid", "name", "genres", "categories"} for every appid
+    found in app_index (missing apps are left out)"""
+
+    _appMetaValidate()
+
+    ids = list(dict.fromkeys(int(a) for a in appids))
+    meta: dict[int, dict] = {}
+
+    with _appMetaLock:
+        for a in ids:
+            hit = _appMeta.get(a)
+            if hit is not None:
+                _appMeta.move_to_end(a)
+                meta[a] = hit
+
+    missing = [a for a in ids if a not in meta]
+
+    if missing:
+        gen = _appMetaGen
+        found: dict[int, dict] = {}
+
+        for part in _chunks(missing):
+            ph = ",".join("?" for _ in part)
+            rows = all_fetch(
+                f"""
+                SELECT appid, name, genres, categories
+                FROM app_index
+                WHERE appid IN ({ph})
+                """,
+                tuple(part)
+            )
+
+            for r in rows:
+                found[int(r["appid"])] = {
+                    "appid": int(r["appid"]),
+                    "name": r["name"],
+                    "genres": json.loads(r["genres"] or "[]"),
+                    "categories": json.loads(r["categories"] or "[]"),
+                }
+
+        # >> an upsert landed while reading -> answer from what we read, dont cache it <<
+        with _appMetaLock:
+            if gen == _appMetaGen:
+                _appMeta.update(found)
+                for a in found:
+                    _appMeta.move_to_end(a)
+                while len(_appMeta) > APPMETA_CACHE_SIZE:
+                    _appMeta.popitem(last = False)
+
+        meta.update(found)
+
+    return {a: meta[a] for a in ids if a in meta}
+
+def appNamesGet(appids: list[int]) -> dict[int, str]:
+    """
+    appid -> name, only for apps that have one"""
+
+    return {a: m["name"] for a, m in appMetaGet(appids).items() if m["name"]}
+
+def appMetaInvalidate(appids: list[int] | None = None) -> None:
+    """
+    drop cached entries (all of them when appids is None)"""
+
+    global _appMetaGen
+
+    with _appMetaLock:
+        _appMetaGen += 1
+
+        if appids is None:
+            _appMeta.clear()
+            return
+
+        for a in appids:
+            _appMeta.pop(int(a), None)
+
+def appAssetCountsGet(appids: list[int]) -> dict[int, dict]:
+    """
+    appid -> {"screenshot_count", "embedding_count"}; two grouped queries
+    for the whole list instead of two COUNTs per app. not cached"""
+
+    ids = list(dict.fromkeys(int(a) for a in appids))
+    counts = {a: {"screenshot_count": 0, "embedding_count": 0} for a in ids}
+
+    for part in _chunks(ids):
+        ph = ",".join("?" for _ in part)
+
+        for table, key in (("app_screenshots", "screenshot_count"), ("screenshot_embeddings", "embedding_count")):
+            rows = all_fetch(
+                f"""
+                SELECT appid, COUNT(*) AS count
+                FROM {table}
+                WHERE appid IN ({ph})
+                GROUP BY appid
+                """,
+                tuple(part)
+            )
+
+            for r in rows:
+                counts[int(r["appid"])][key] = int(r["count"])
+
+    return counts
@@ -0,0 +1,233 @@
+import argparse
+import numpy as np
+
+from collections import Counter
+from db import all_fetch, get_connection, timestamp, dbInitiate
+from appmatrix import appMatrixGet, appLabelsGet
+from rec import scoreReasonsGet
+from cooc import coocScoresGet, coocBlend, coocReasonGet
+
+# >>> offline recommendation job.
+# builds the genre / category profile matrix for every synced user,
+# multiplies it against the catalogue matrix chunk by chunk and stores
+# the top k per user in [recommendations]. /rec serves from there. <<<
+
+def _postingsExpand(indptr: np.ndarray, feat: np.ndarray, a: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    for each app row in a -> its label ids, flattened.
+    returns (index into a, label id)"""
+
+    starts = indptr[a]
+    counts = indptr[a + 1] - starts
+
+    owner = np.repeat(np.arange(len(a)), counts)
+    offs = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return owner, feat[starts[owner] + offs]
+
+def profileMatrixGet(M: dict, steamids: list[str], TopGames_n: int = 50) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (users x genres, users x categories) profile matrices.
+    same weights + filters as BuildUserProfiles, but from app_genres / app_categories"""
+
+    ph = ",".join("?" for _ in steamids)
+    rows = all_fetch(
+        f"""
+        SELECT steamid64, appid, pt_forever_min
+        FROM (
+            SELECT steamid64, appid, pt_forever_min,
+                ROW_NUMBER() OVER (PARTITION BY steamid64 ORDER BY pt_forever_min DESC) AS rn
+            FROM owned_games
+            WHERE steamid64 IN ({ph})
+        )
+        WHERE rn <= ?
+        """,
+        (*steamids, TopGames_n)
+    )
+
+    G = np.zeros((len(steamids), len(M["genreVocab"])), dtype=np.float64)
+    C = np.zeros((len(steamids), len(M["catVocab"])), dtype=np.float64)
+
+    if not rows or not len(M["appids"]):
+        return G, C
+
+    userIdx = {sid: i for i, sid in enumerate(steamids)}
+    u = np.array([userIdx[r["steamid64"]] for r in rows], dtype=np.int64)
+    appids = np.array([int(r["appid"]) for r in rows], dtype=np.int64)
+    mins = np.array([int(r["pt_forever_min"]) for r in rows], dtype=np.int64)
+
+    # >> only apps in the catalogue contribute (same as a missing appdetails in the live path) <<
+    a = np.searchsorted(M["appids"], appids)
+    a = np.minimum(a, len(M["appids"]) - 1)
+    found = M["appids"][a] == appids
+
+    u, a, mins = u[found], a[found], mins[found]
+    w = np.log1p(mins.astype(np.float64))
+
+    # >> genre profile ignores games with less than 30 minutes playtime <<
+    g = mins >= 30
+    owner, feat = _postingsExpand(M["gIndptr"], M["gFeat"], a[g])
+    np.add.at(G, (u[g][owner], feat), w[g][owner])
+
+    owner, feat = _postingsExpand(M["cIndptr"], M["cFeat"], a)
+    np.add.at(C, (u[owner], feat), w[owner])
+
+    return G, C
+
+def _featureMatrixGet(n: int, nFeat: int, rows: np.ndarray, feat: np.ndarray) -> np.ndarray:
+    A = np.zeros((n, nFeat), dtype=np.float64)
+    np.add.at(A, (rows, feat), 1.0)
+    return A
+
+def usersGet() -> list[str]:
+    rows = all_fetch(
+        """
+        SELECT steamid64 FROM users
+        UNION
+        SELECT DISTINCT steamid64 FROM owned_games
+        """
+    )
+    return [r["steamid64"] for r in rows]
+
+def runBatchRecs(topK: int = 50, chunk: int = 256, catWeight: float = 0.35, maxCells: int = 20_000_000) -> dict:
+    """
+    recompute [recommendations] for every user.
+    users are processed in chunks so the (users x apps) score block stays
+    under maxCells entries."""
+
+    M = appMatrixGet()
+    n = len(M["appids"])
+    steamids = usersGet()
+    computedAt = timestamp()
+
+    if n == 0 or not steamids:
+        return {"users": len(steamids), "apps": n, "written": 0, "skipped": len(steamids), "computed_at": computedAt}
+
+    Ag = _featureMatrixGet(n, len(M["genreVocab"]), M["gRows"], M["gFeat"])
+    Ac = _featureMatrixGet(n, len(M["catVocab"]), M["cRows"], M["cFeat"])
+
+    chunk = max(1, min(chunk, maxCells // n))
+    k = min(topK, n)
+
+    written = 0
+    skipped = 0
+
+    for start in range(0, len(steamids), chunk):
+        sids = steamids[start:start + chunk]
+        G, C = profileMatrixGet(M, sids)
+
+        scores = G @ Ag.T + catWeight * (C @ Ac.T)
+
+        # >> remove owned titles <<
+        ph = ",".join("?" for _ in sids)
+        owned = all_fetch(f"SELECT steamid64, appid FROM owned_games WHERE steamid64 IN ({ph})", tuple(sids))
+
+        if owned:
+            userIdx = {sid: i for i, sid in enumerate(sids)}
+            ou = np.array([userIdx[r["steamid64"]] for r in owned], dtype=np.int64)
+            oa = np.array([int(r["appid"]) for r in owned], dtype=np.int64)
+            pos = np.minimum(np.searchsorted(M["appids"], oa), n - 1)
+            hit = M["appids"][pos] == oa
+            scores[ou[hit], pos[hit]] = -np.inf
+
+        if k < n:
+            top = np.argpartition(-scores, k - 1, axis = 1)[:, :k]
+        else:
+            top = np.tile(np.arange(n), (len(sids), 1))
+
+        rows = []
+
+        for i, sid in enumerate(sids):
+            # >> no genre profile -> live /rec would return nothing either <<
+            if not G[i].any():
+                skipped += 1
+                continue
+
+            written += 1
+
+            # >> blend co-ownership per user, then re-pick the top k for that row <<
+            cf = coocScoresGet(sid)
+            if cf:
+                coocBlend(scores[i], M["appids"], cf)
+                top[i] = np.argpartition(-scores[i], k - 1)[:k] if k < n else np.arange(n)
+
+            t = top[i]
+            t = t[np.lexsort((t, -scores[i, t]))]
+            t = t[np.isfinite(scores[i, t])]
+
+            for rank, j in enumerate(t, start = 1):
+                rows.append((sid, rank, int(M["appids"][j]), float(scores[i, j]), computedAt))
+
+        connection = get_connection()
+        connection.execute(f"DELETE FROM recommendations WHERE steamid64 IN ({ph})", tuple(sids))
+        connection.executemany(
+            """
+            INSERT INTO recommendations (steamid64, rank, appid, score, computed_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        connection.commit()
+        connection.close()
+
+    return {
+        "users": len(steamids),
+        "apps": n,
+        "written": written,
+        "skipped": skipped,
+        "chunk": chunk,
+        "computed_at": computedAt,
+    }
+
+def precomputedRecsGet(steamid64: str, genreProfile: Counter, catProfile: Counter, exclude: set[int] | None = None, k: int = 20, cf: dict | None = None) -> dict | None:
+    """
+    stored recommendations for one user (None if the user isnt in the table).
+    anything owned since the job ran is dropped; reasons built on the way out"""
+
+    rows = all_fetch(
+        """
+        SELECT appid, score, computed_at
+        FROM recommendations
+        WHERE steamid64 = ?
+        ORDER BY rank ASC
+        """,
+        (steamid64,)
+    )
+
+    if not rows:
+        return None
+
+    M = appMatrixGet()
+    exclude = exclude or set()
+    recs = []
+
+    for r in rows:
+        appid = int(r["appid"])
+        if appid in exclude:
+            continue
+
+        i = int(np.searchsorted(M["appids"], appid))
+        if i < len(M["appids"]) and M["appids"][i] == appid:
+            genres, cats = appLabelsGet(M, i)
+            reasons = scoreReasonsGet(genres, cats, genreProfile, catProfile)
+        else:
+            reasons = []
+
+        if cf and appid in cf:
+            reasons.append(coocReasonGet(cf, appid))
+
+        recs.append({"appid": appid, "Score": float(r["score"]), "Reasons": reasons})
+
+        if len(recs) >= k:
+            break
+
+    return {"recommendations": recs, "computed_at": int(rows[0]["computed_at"])}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="precompute recommendations for every synced user")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--chunk", type=int, default=256)
+    args = parser.parse_args()
+
+    dbInitiate()
+    print(runBatchRecs(topK=args.top_k, chunk=args.chunk))
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+from pathlib import Path
+
+# >>> recommendation pipeline benchmarks on a synthetic catalogue.
+# builds a throwaway sqlite db (apps, labels, pre-cached app_details, users,
+# libraries) so nothing touches the network, times the rec hot paths and
+# prints one json document. compare runs across versions with e.g.
+#   python bench.py --apps 20000 --out bench-$(git rev-parse --short HEAD).json <<<
+
+os.environ.setdefault("CLIP_LOAD_MODE", "lazy")
+
+import db
+
+GENRE_NAMES = [
+    "Action", "Adventure", "RPG", "Strategy", "Simulation", "Indie", "Casual", "Sports",
+    "Racing", "Puzzle", "Platformer", "Shooter", "Horror", "Survival", "Sandbox", "Roguelike",
+    "Card Game", "Visual Novel", "MMO", "Fighting", "Rhythm", "Stealth", "Tower Defense", "Metroidvania",
+]
+CATEGORY_NAMES = [
+    "Single-player", "Multi-player", "Co-op", "Online Co-op", "PvP", "Online PvP", "Steam Achievements",
+    "Full controller support", "Steam Cloud", "Steam Trading Cards", "Steam Workshop", "In-App Purchases",
+    "Partial Controller Support", "Remote Play Together", "Shared/Split Screen", "Cross-Platform Multiplayer",
+    "Steam Leaderboards", "Includes level editor", "VR Support", "Family Sharing",
+]
+
+def labelsGet(names: list[str], n: int) -> list[str]:
+    """
+    real label names first, then synthetic ones past the end"""
+
+    return [names[i] if i < len(names) else f"{names[0].split()[0]} {i}" for i in range(n)]
+
+def zipfWeights(n: int, s: float) -> list[float]:
+    return [1.0 / (i + 1) ** s for i in range(n)]
+
+def sampleDistinct(rng: random.Random, population: list, weights: list[float], k: int) -> list:
+    k = min(k, len(population))
+    picked = []
+    seen = set()
+
+    while len(picked) < k:
+        for x in rng.choices(population, weights=weights, k=k - len(picked)):
+            if x not in seen:
+                seen.add(x)
+                picked.append(x)
+
+    return picked
+
+def buildSyntheticDb(args) -> dict:
+    """
+    fill the (already initialised) db with a synthetic catalogue + users.
+    label popularity and game ownership are zipf skewed like the real store"""
+
+    from db import get_connection, appLabelsWrite, timestamp
+    from steamdata import detailsEncode
+
+    rng = random.Random(args.seed)
+    ts = timestamp()
+
+    genres = labelsGet(GENRE_NAMES, args.genres)
+    cats = labelsGet(CATEGORY_NAMES, args.categories)
+    gW = zipfWeights(len(genres), args.skew)
+    cW = zipfWeights(len(cats), args.skew)
+
+    appids = list(range(10, 10 * (args.apps + 1), 10))
+
+    connection = get_connection()
+    detailRows = []
+    indexRows = []
+
+    for appid in appids:
+        g = sampleDistinct(rng, genres, gW, rng.randint(1, args.genres_per_app))
+        c = sampleDistinct(rng, cats, cW, rng.randint(1, args.cats_per_app))
+
+        details = {
+            "type": "game",
+            "name": f"Synthetic Game {appid}",
+            "steam_appid": appid,
+            "genres": [{"id": str(genres.index(x)), "description": x} for x in g],
+            "categories": [{"id": str(cats.index(x)), "description": x} for x in c],
+            "screenshots": [],
+        }
+
+        detailRows.append((appid, detailsEncode(details), ts))
+        indexRows.append((appid, details["name"], json.dumps(g), json.dumps(c), ts))
+        appLabelsWrite(connection, appid, g, c)
+
+    connection.executemany("INSERT INTO app_details (appid, json, fetched_at) VALUES (?, ?, ?)", detailRows)
+    connection.executemany("INSERT INTO app_index (appid, name, genres, categories, updated_at) VALUES (?, ?, ?, ?, ?)", indexRows)
+
+    appW = zipfWeights(len(appids), args.skew * 0.6)
+    steamids = [str(76561198000000000 + u) for u in range(args.users)]
+    ownedRows = []
+
+    for sid in steamids:
+        lib = sampleDistinct(rng, appids, appW, rng.randint(max(1, args.library // 2), args.library))
+        for appid in lib:
+            # >> lots of barely played games, a long tail of heavy ones <<
+            mins = 0 if rng.random() < 0.3 else int(rng.lognormvariate(5.0, 1.6))
+            ownedRows.append((sid, appid, f"Synthetic Game {appid}", mins, ts))
+
+    connection.executemany("INSERT INTO users (steamid64, created_at) VALUES (?, ?)", [(sid, ts) for sid in steamids])
+    connection.executemany("INSERT INTO owned_games (steamid64, appid, name, pt_forever_min, last_synced) VALUES (?, ?, ?, ?, ?)", ownedRows)
+    connection.commit()
+    connection.close()
+
+    return {"apps": len(appids), "users": len(steamids), "owned_rows": len(ownedRows)}
+
+def statsGet(samples: list[float], items: int | None = None) -> dict:
+    out = {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+    if items:
+        out["items"] = items
+        out["per_item_us"] = round(statistics.median(samples) / items * 1e6, 3)
+    return out
+
+async def timeAsync(fn, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t)
+    return samples
+
+def cachesClear() -> None:
+    """
+    drop every in-process + stored derived cache so a run starts cold"""
+
+    import rec
+    import appmatrix
+    import appmeta
+    import steamdata
+
+    rec._profileCache.clear()
+    appmatrix._appMatrix = None
+    appmeta.appMetaInvalidate()
+    steamdata.detailsCacheInvalidate()
+    db.exec("DELETE FROM user_profiles")
+    db.exec("DELETE FROM recommendations")
+
+async def runBench(args) -> dict:
+    import httpx
+    import steamdata
+    import rec
+    import main
+    import batchrec
+
+    # >> everything is pre-cached; a network fetch means the bench is broken <<
+    async def noNetwork(appid: int, *a, **k):
+        raise RuntimeError(f"benchmark tried to fetch appdetails for {appid}")
+
+    steamdata.f_appdetails_store = noNetwork
+
+    rng = random.Random(args.seed + 1)
+    steamids = [r["steamid64"] for r in db.all_fetch("SELECT steamid64 FROM users ORDER BY steamid64")]
+    sids = rng.sample(steamids, min(args.sample_users, len(steamids)))
+    results = {}
+
+    # >> profile building (legacy sequential + combined) <<
+    samples = []
+    for sid in sids:
+        samples += await timeAsync(lambda: rec.BuildUserProfile_genre(sid), 1)
+    results["BuildUserProfile_genre"] = statsGet(samples)
+
+    samples = []
+    for sid in sids:
+        samples += await timeAsync(lambda: rec.BuildUserProfiles(sid), 1)
+    results["BuildUserProfiles"] = statsGet(samples)
+
+    profiles = {sid: await rec.BuildUserProfiles(sid) for sid in sids}
+
+    # >> candidate generation <<
+    samples = []
+    cands = {}
+    for sid in sids:
+        t = time.perf_counter()
+        cands[sid] = rec.GenCandidates(profiles[sid][0], steamid64=sid)
+        samples.append(time.perf_counter() - t)
+    results["GenCandidates"] = statsGet(samples, items=round(statistics.fmean(len(c) for c in cands.values())))
+
+    # >> scoring loops <<
+    async def scoringLoop(sid):
+        g, c = profiles[sid]
+        for appid in cands[sid]:
+            await rec.GameScoring(appid, g, c)
+
+    samples = []
+    for sid in sids:
+        samples += await timeAsync(lambda: scoringLoop(sid), 1)
+    results["GameScoring_loop"] = statsGet(samples, items=round(statistics.fmean(len(c) for c in cands.values())))
+
+    samples = []
+    for sid in sids:
+        g, c = profiles[sid]
+        samples += await timeAsync(lambda: rec.ScoreGameMulti(cands[sid], sid, g, c), 1)
+    results["ScoreGameMulti"] = statsGet(samples, items=round(statistics.fmean(len(c) for c in cands.values())))
+
+    # >> full /rec handler through the asgi app <<
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def recCall(sid):
+            r = await client.get("/rec", cookies={"session": main.serializer.dumps({"steamid64": sid})})
+            r.raise_for_status()
+            return r.json()
+
+        cold = []
+        for sid in sids:
+            cachesClear()
+            cold += await timeAsync(lambda: recCall(sid), 1)
+        results["rec_live_cold"] = statsGet(cold)
+
+        for sid in sids:
+            await recCall(sid)
+        warm = []
+        for sid in sids:
+            warm += await timeAsync(lambda: recCall(sid), args.repeat)
+        results["rec_live_warm"] = statsGet(warm)
+
+        t = time.perf_counter()
+        batch = await asyncio.to_thread(batchrec.runBatchRecs)
+        results["runBatchRecs"] = statsGet([time.perf_counter() - t], items=batch["users"])
+
+        pre = []
+        for sid in sids:
+            pre += await timeAsync(lambda: recCall(sid), args.repeat)
+        results["rec_precomputed"] = statsGet(pre)
+
+    return results
+
+def versionGet() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="benchmark the recommendation pipeline on a synthetic catalogue")
+    parser.add_argument("--apps", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--genres-per-app", type=int, default=4)
+    parser.add_argument("--cats-per-app", type=int, default=8)
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent for label + ownership popularity")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--library", type=int, default=200, help="max games per user")
+    parser.add_argument("--sample-users", type=int, default=10, help="users timed per benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", type=str, default=None, help="sqlite path (default: temp file, removed afterwards)")
+    parser.add_argument("--out", type=str, default=None, help="write json here as well as stdout")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.NamedTemporaryFile(prefix="bench-", suffix=".sqlite3", delete=False)
+        tmp.close()
+        args.db = tmp.name
+    elif Path(args.db).exists():
+        parser.error(f"{args.db} already exists; bench only runs against a fresh db")
+
+    db.db_path = Path(args.db)
+
+    try:
+        db.dbInitiate()
+
+        t = time.perf_counter()
+        data = buildSyntheticDb(args)
+        data["build_sec"] = round(time.perf_counter() - t, 3)
+
+        results = asyncio.run(runBench(args))
+    finally:
+        if tmp is not None:
+            os.remove(tmp.name)
+
+    report = {
+        "version": versionGet(),
+        "timestamp": db.timestamp(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("db", "out")},
+        "data": data,
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,496 @@
+import re
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+
+from json import JSONDecoder, JSONDecodeError
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import db
+import steamdata
+
+from db import all_fetch, single_fetch, exec, timestamp, dbInitiate
+from httpclient import httpClientGet, timeoutFor
+from ratelimit import AdaptiveRateLimiter, retryAfterParse
+from steamdata import f_appdetails_bulk, knownBadAppidsGet, steam_api_key, STEAM_API_BASE
+
+# >>> full steam catalogue -> app_index.
+# pages of IStoreService/GetAppList are streamed + parsed item by item (the
+# list is never held in memory as a whole), diffed against app_index, and
+# anything new or modified since we indexed it goes through f_appdetails_bulk
+# (so storeLimiter's budget applies). progress is checkpointed per appid in
+# [catalog_checkpoints]; an interrupted run picks up where it stopped and a
+# finished one makes the next run incremental (if_modified_since). <<<
+
+CATALOG_SOURCE = "steam_applist"
+CATALOG_PAGE_SIZE = 10000
+CATALOG_CHECKPOINT_EVERY = 50
+
+_decoder = JSONDecoder()
+
+class AppListParser:
+    """
+    incremental parser for one GetAppList page.
+    feed() text as it arrives, get back the app objects completed so far;
+    everything outside the "apps" array is kept as text for metaGet()"""
+
+    def __init__(self):
+        self.state = "seek"
+        self.buf = ""
+        self.outside = ""
+
+    def feed(self, text: str) -> list[dict]:
+        self.buf += text
+        apps = []
+
+        if self.state == "seek":
+            i = self.buf.find('"apps"')
+            j = self.buf.find("[", i) if i >= 0 else -1
+
+            if j < 0:
+                # >> key found: keep it until its "[" arrives. otherwise keep a
+                # few chars back in case the key is split across chunks <<
+                cut = i if i >= 0 else max(0, len(self.buf) - 8)
+                self.outside += self.buf[:cut]
+                self.buf = self.buf[cut:]
+                return apps
+
+            self.outside += self.buf[:i]
+            self.buf = self.buf[j + 1:]
+            self.state = "items"
+
+        if self.state == "items":
+            pos = 0
+            n = len(self.buf)
+
+            while True:
+                while pos < n and self.buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= n:
+                    break
+
+                if self.buf[pos] == "]":
+                    self.state = "tail"
+                    self.outside += self.buf[pos + 1:]
+                    self.buf = ""
+                    return apps
+
+                try:
+                    obj, pos = _decoder.raw_decode(self.buf, pos)
+                except JSONDecodeError:
+                    # >> item not complete yet <<
+                    break
+
+                apps.append(obj)
+
+            self.buf = self.buf[pos:]
+
+        elif self.state == "tail":
+            self.outside += self.buf
+            self.buf = ""
+
+        return apps
+
+    def close(self) -> None:
+        if self.state == "items" and self.buf.strip():
+            raise ValueError("app list ended inside the apps array")
+        self.outside += self.buf
+        self.buf = ""
+
+    def metaGet(self) -> dict:
+        more = re.search(r'"have_more_results"\s*:\s*(true|false)', self.outside)
+        last = re.search(r'"last_appid"\s*:\s*(\d+)', self.outside)
+        return {
+            "have_more_results": bool(more and more.group(1) == "true"),
+            "last_appid": int(last.group(1)) if last else None,
+        }
+
+async def appListPageStream(lastAppid: int, since: int, pageSize: int = CATALOG_PAGE_SIZE, baseUrl: str | None = None):
+    """
+    yields each app of one page, then a final {"_meta": {...}}"""
+
+    url = f"{(baseUrl or STEAM_API_BASE).rstrip('/')}/IStoreService/GetAppList/v1/"
+    params = {
+        "key": steam_api_key,
+        "include_games": 1,
+        "last_appid": lastAppid,
+        "max_results": pageSize,
+    }
+    if since:
+        params["if_modified_since"] = since
+
+    parser = AppListParser()
+
+    async with httpClientGet().stream("GET", url, params=params, timeout=timeoutFor(url)) as response:
+        response.raise_for_status()
+
+        async for chunk in response.aiter_text():
+            for app in parser.feed(chunk):
+                yield app
+
+    parser.close()
+    yield {"_meta": parser.metaGet()}
+
+def checkpointGet(name: str = CATALOG_SOURCE) -> dict | None:
+    row = single_fetch("SELECT * FROM catalog_checkpoints WHERE name = ?", (name,))
+    return dict(row) if row else None
+
+def _checkpointStart(name: str) -> dict:
+    """
+    resume a running checkpoint, or start a new run (incremental after a finished one)"""
+
+    cp = checkpointGet(name)
+    if cp and cp["status"] == "running":
+        return cp
+
+    now = timestamp()
+    since = cp["started_at"] if cp and cp["status"] == "done" else 0
+
+    exec(
+        """
+        INSERT INTO catalog_checkpoints (name, status, last_appid, since, seen, queued, fetched, failed, started_at, updated_at, finished_at)
+        VALUES (?, 'running', 0, ?, 0, 0, 0, 0, ?, ?, NULL)
+        ON CONFLICT(name) DO UPDATE SET
+            status = 'running',
+            last_appid = 0,
+            since = excluded.since,
+            seen = 0, queued = 0, fetched = 0, failed = 0,
+            started_at = excluded.started_at,
+            updated_at = excluded.updated_at,
+            finished_at = NULL
+        """,
+        (name, since, now, now)
+    )
+    return checkpointGet(name)
+
+def _checkpointSave(name: str, cp: dict, status: str = "running") -> None:
+    exec(
+        """
+        UPDATE catalog_checkpoints
+        SET status = ?, last_appid = ?, seen = ?, queued = ?, fetched = ?, failed = ?,
+            updated_at = ?, finished_at = ?
+        WHERE name = ?
+        """,
+        (
+            status, cp["last_appid"], cp["seen"], cp["queued"], cp["fetched"], cp["failed"],
+            timestamp(), timestamp() if status == "done" else None, name,
+        )
+    )
+
+def catalogDiff(apps: list[dict]) -> list[int]:
+    """
+    appids that are new to app_index, or modified on steam since we indexed them.
+    known bad appids are left to their failure ttl"""
+
+    byId = {int(a["appid"]): int(a.get("last_modified") or 0) for a in apps if a.get("appid")}
+    ids = list(byId)
+    indexed: dict[int, int] = {}
+
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        ph = ",".join("?" for _ in part)
+        for r in all_fetch(f"SELECT appid, updated_at FROM app_index WHERE appid IN ({ph})", tuple(part)):
+            indexed[int(r["appid"])] = int(r["updated_at"])
+
+    want = [a for a in ids if a not in indexed or byId[a] > indexed[a]]
+    bad = knownBadAppidsGet(want)
+
+    return sorted(a for a in want if a not in bad)
+
+async def catalogIngest(maxApps: int | None = None, pageSize: int = CATALOG_PAGE_SIZE, concurrency: int = 8, baseUrl: str | None = None, name: str = CATALOG_SOURCE) -> dict:
+    """
+    one ingest run (or the next part of one). maxApps caps how many
+    appdetails are fetched this call; the checkpoint stays "running" so the
+    next call resumes"""
+
+    cp = _checkpointStart(name)
+    fetchedThisCall = 0
+
+    while True:
+        apps = []
+        meta = {"have_more_results": False, "last_appid": None}
+
+        async for item in appListPageStream(cp["last_appid"], cp["since"], pageSize, baseUrl):
+            if "_meta" in item:
+                meta = item["_meta"]
+            else:
+                apps.append({"appid": item.get("appid"), "last_modified": item.get("last_modified")})
+
+        if not apps:
+            _checkpointSave(name, cp, "done")
+            break
+
+        cp["seen"] += len(apps)
+        want = catalogDiff(apps)
+        todo = want if maxApps is None else want[:max(0, maxApps - fetchedThisCall)]
+
+        cp["queued"] += len(todo)
+
+        # >> checkpoint = highest appid with everything below it done this page <<
+        done = set()
+        nextIdx = 0
+
+        async for appid, details, err in f_appdetails_bulk(todo, concurrency=concurrency, forceRef=True):
+            done.add(appid)
+            fetchedThisCall += 1
+
+            if details:
+                cp["fetched"] += 1
+            else:
+                cp["failed"] += 1
+
+            while nextIdx < len(todo) and todo[nextIdx] in done:
+                nextIdx += 1
+
+            if nextIdx and len(done) % CATALOG_CHECKPOINT_EVERY == 0:
+                cp["last_appid"] = todo[nextIdx - 1]
+                _checkpointSave(name, cp)
+
+        if len(todo) < len(want):
+            # >> capped partway through the page: resume right after the last app fetched <<
+            if todo:
+                cp["last_appid"] = todo[-1]
+            _checkpointSave(name, cp)
+            break
+
+        cp["last_appid"] = meta["last_appid"] or max(int(a["appid"]) for a in apps if a.get("appid"))
+
+        if not meta["have_more_results"]:
+            _checkpointSave(name, cp, "done")
+            break
+
+        _checkpointSave(name, cp)
+
+        if maxApps is not None and fetchedThisCall >= maxApps:
+            break
+
+    return checkpointGet(name)
+
+# >>> local stand-in for steam, serving a recorded catalogue:
+#   {"apps": [{"appid", "name", "last_modified"}, ...], "details": {"<appid>": {...}},
+#    "owned": {"<steamid64>": [{"appid", "name", "playtime_forever"}, ...]},
+#    "throttle": {"<appid>": n}, "retry_after": "1"}
+# point STEAM_API_BASE + STEAM_STORE_BASE at it. "owned" is read per request,
+# so a caller can change a library between syncs. the first n appdetails
+# calls for a throttled appid get a 429 with Retry-After. <<<
+def standInServer(recording: dict, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    apps = sorted(recording.get("apps", []), key = lambda a: int(a["appid"]))
+    details = recording.get("details", {})
+    throttle = dict(recording.get("throttle", {}))
+    throttleLock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body: dict, status: int = 200, headers: dict | None = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+
+            if parts.path.rstrip("/") == "/IStoreService/GetAppList/v1":
+                last = int(q.get("last_appid", 0))
+                since = int(q.get("if_modified_since", 0))
+                n = int(q.get("max_results", CATALOG_PAGE_SIZE))
+
+                rest = [a for a in apps if int(a["appid"]) > last and int(a.get("last_modified", 0)) > since]
+                page = rest[:n]
+
+                resp = {"apps": page}
+                if len(rest) > n:
+                    resp["have_more_results"] = True
+                    resp["last_appid"] = int(page[-1]["appid"])
+                return self._send({"response": resp if page else {}})
+
+            if parts.path.rstrip("/") == "/IPlayerService/GetOwnedGames/v0001":
+                games = recording.get("owned", {}).get(q.get("steamid", ""), [])
+                return self._send({"response": {"game_count": len(games), "games": games} if games else {}})
+
+            if parts.path.rstrip("/") == "/api/appdetails":
+                appid = q.get("appids", "")
+
+                with throttleLock:
+                    limited = throttle.get(appid, 0) > 0
+                    if limited:
+                        throttle[appid] -= 1
+                if limited:
+                    return self._send({}, 429, {"Retry-After": str(recording.get("retry_after", "1"))})
+
+                d = details.get(appid)
+                return self._send({appid: {"success": True, "data": d} if d else {"success": False}})
+
+            self._send({"error": "not found"}, 404)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+def standInStart(recording: dict) -> tuple[ThreadingHTTPServer, str]:
+    """
+    serve in a background thread; returns (server, base url)"""
+
+    server = standInServer(recording)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+# >>> self checks against the stand-in (python catalog.py check).
+# run on a throwaway sqlite file; nothing touches steam or db.sqlite3. <<<
+def parserCheck() -> None:
+    """
+    a page split at every offset (and fed a char at a time) parses the same"""
+
+    page = {"response": {
+        "apps": [
+            {"appid": 10, "name": "Counter-Strike", "last_modified": 1},
+            {"appid": 20, "name": "Team \"Fortress\" [Classic]", "last_modified": 2},
+            {"appid": 30, "name": "Day of Defeat, {GOTY}", "last_modified": 3},
+        ],
+        "have_more_results": True,
+        "last_appid": 30,
+    }}
+    want = [a["appid"] for a in page["response"]["apps"]]
+    meta = {"have_more_results": True, "last_appid": 30}
+
+    compact = json.dumps(page)
+    texts = [
+        compact,
+        json.dumps(page, indent = 2),
+        # >> "apps" and its "[" in different chunks, far apart <<
+        compact.replace('"apps": ', '"apps":' + " " * 64),
+    ]
+
+    for text in texts:
+        splits = [[text[:i], text[i:]] for i in range(len(text) + 1)] + [list(text)]
+
+        for chunks in splits:
+            p = AppListParser()
+            got = [a["appid"] for c in chunks for a in p.feed(c)]
+            p.close()
+
+            assert got == want, (chunks[0][-20:], got)
+            assert p.metaGet() == meta, (chunks[0][-20:], p.metaGet())
+
+    print("parser check ok")
+
+async def resumeCheck() -> None:
+    """
+    an ingest capped partway through a page resumes from its checkpoint
+    instead of re-listing from the start, then finishes; the next run is incremental"""
+
+    apps = [{"appid": a, "name": f"App {a}", "last_modified": 100} for a in range(1, 31)]
+    details = {str(a["appid"]): {"type": "game", "name": a["name"], "genres": [{"id": "1", "description": "Action"}]} for a in apps}
+    del details["7"]    # >> success: false -> counted as failed <<
+
+    server, base = standInStart({"apps": apps, "details": details})
+    store, limiter = steamdata.STEAM_STORE_BASE, steamdata.storeLimiter
+    steamdata.STEAM_STORE_BASE = base
+    steamdata.storeLimiter = AdaptiveRateLimiter(rate = 1000, burst = 1000, minRate = 1, increase = 1)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.db_path = Path(tmp) / "check.sqlite3"
+            dbInitiate()
+
+            # >> pages of 8: page 2 gets capped after its 2nd app <<
+            cp = await catalogIngest(maxApps = 10, pageSize = 8, concurrency = 4, baseUrl = base)
+            assert cp["status"] == "running" and cp["last_appid"] == 10, cp
+            assert cp["fetched"] + cp["failed"] == 10 and cp["seen"] == 16, cp
+
+            cp = await catalogIngest(pageSize = 8, concurrency = 4, baseUrl = base)
+            assert cp["status"] == "done", cp
+            assert cp["fetched"] == 29 and cp["failed"] == 1, cp
+            # >> resumed after appid 10: 16 seen before + 20 after, not + 30 <<
+            assert cp["seen"] == 36, cp
+
+            indexed = {int(r["appid"]) for r in all_fetch("SELECT appid FROM app_index")}
+            assert indexed == {a["appid"] for a in apps} - {7}, sorted(indexed)
+
+            cp = await catalogIngest(pageSize = 8, baseUrl = base)
+            assert cp["status"] == "done" and cp["seen"] == 0, cp
+    finally:
+        steamdata.STEAM_STORE_BASE, steamdata.storeLimiter = store, limiter
+        server.shutdown()
+
+    print("resume check ok")
+
+async def limiterCheck() -> None:
+    """
+    AIMD on storeLimiter against 429s from the stand-in:
+    each 429 halves the rate and pauses for Retry-After, successes add it back"""
+
+    assert retryAfterParse("3", 2.0) == 3.0
+    assert retryAfterParse(None, 2.0) == 2.0 and retryAfterParse("soon", 2.0) == 2.0
+    assert retryAfterParse("Thu, 01 Jan 1970 00:00:00 GMT", 2.0) == 0.0
+
+    details = {str(a): {"type": "game", "name": f"App {a}"} for a in range(1, 7)}
+    server, base = standInStart({"details": details, "throttle": {"1": 2}, "retry_after": "1"})
+
+    store, limiter = steamdata.STEAM_STORE_BASE, steamdata.storeLimiter
+    steamdata.STEAM_STORE_BASE = base
+    steamdata.storeLimiter = lim = AdaptiveRateLimiter(rate = 8, burst = 8, minRate = 0.5, increase = 1)
+
+    try:
+        started = asyncio.get_running_loop().time()
+        data = await steamdata.f_appdetails_store(1)
+        took = asyncio.get_running_loop().time() - started
+
+        # >> two 429s: 8 -> 4 -> 2, then +1 for the success; each paused 1s <<
+        assert data and data["name"] == "App 1", data
+        assert lim.throttled == 2 and lim.rate == 3, lim.stats()
+        assert took >= 1.9, took
+
+        for a in range(2, 7):
+            await steamdata.f_appdetails_store(a)
+        assert lim.rate == lim.maxRate, lim.stats()
+
+        for _ in range(10):
+            lim.throttle(0)
+        assert lim.rate == lim.minRate, lim.stats()
+    finally:
+        steamdata.STEAM_STORE_BASE, steamdata.storeLimiter = store, limiter
+        server.shutdown()
+
+    print("limiter check ok")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="steam catalogue ingest")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    ing = sub.add_parser("ingest", help="run / resume an ingest")
+    ing.add_argument("--max-apps", type=int, default=None)
+    ing.add_argument("--page-size", type=int, default=CATALOG_PAGE_SIZE)
+    ing.add_argument("--concurrency", type=int, default=8)
+
+    srv = sub.add_parser("serve", help="serve a recorded catalogue as a steam stand-in")
+    srv.add_argument("recording")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+
+    sub.add_parser("check", help="parser / resume / rate limiter checks against the stand-in")
+
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        with open(args.recording) as f:
+            server = standInServer(json.load(f), args.host, args.port)
+        print(f"serving on http://{args.host}:{args.port}", file=sys.stderr)
+        server.serve_forever()
+    elif args.cmd == "check":
+        parserCheck()
+        asyncio.run(resumeCheck())
+        asyncio.run(limiterCheck())
+    else:
+        dbInitiate()
+        print(json.dumps(asyncio.run(catalogIngest(args.max_apps, args.page_size, args.concurrency)), indent=2))
@@ -1,21 +1,79 @@
-import torch
+import os
+import threading
 import numpy as np
 
 from img import LoadImageViaURL, TryLoadUploadedImg
 from db import all_fetch, exec, single_fetch, timestamp
+from appmeta import appNamesGet
 
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
+from collections import Counter, OrderedDict
 from fastapi import UploadFile
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-MODEL_NAME = "openai/clip-vit-base-patch32"
+MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
 
-model = CLIPModel.from_pretrained(MODEL_NAME).to(DEVICE)
-processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+# >> "eager" -> load + warm up in the background at startup. 
+# "lazy" -> load on first use. torch / transformers only get imported when loading. <<
+CLIP_LOAD_MODE = os.getenv("CLIP_LOAD_MODE", "eager").lower()
+
+DEVICE = None
+model = None
+processor = None
+
+_modelLock = threading.Lock()
+_modelWarm = False
+_modelError: str | None = None
+
+def modelGet():
+    """
+    returns (model, processor); loads them the first time round."""
+
+    global DEVICE, model, processor, _modelError
+
+    if model is not None:
+        return model, processor
+
+    with _modelLock:
+        if model is None:
+            try:
+                import torch
+                from transformers import CLIPProcessor, CLIPModel
+
+                DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+                processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+                model = CLIPModel.from_pretrained(MODEL_NAME).to(DEVICE)
+                _modelError = None
+            except Exception as e:
+                _modelError = str(e)
+                raise
+
+    return model, processor
+
+def modelWarmup() -> None:
+    """
+    load model + run a dummy forward pass through both encoders
+    so the first real request doesnt pay for it."""
+
+    global _modelWarm
+
+    modelGet()
+    EmbedPILImg(Image.new("RGB", (224, 224)))
+    embTxtPrompts(["warmup"])
+    _modelWarm = True
+
+def modelState() -> dict:
+    return {
+        "mode": CLIP_LOAD_MODE,
+        "loaded": model is not None,
+        "warm": _modelWarm,
+        "device": DEVICE,
+        "error": _modelError,
+    }
 
 # >> accept either a tensor or a HF model output containing the embedding tensor. <<
-def _embedding_tensor(vec) -> torch.Tensor:
+def _embedding_tensor(vec):
+    import torch
+
     if isinstance(vec, torch.Tensor):
         return vec
 
@@ -43,6 +101,9 @@ def embTxtPrompts(prompts: list[str]) -> np.ndarray:
     """
     convert list of txt prompts to normalised clip embeddings"""
 
+    import torch
+    model, processor = modelGet()
+
     inputs = processor(
         text = prompts,
         return_tensors = "pt",
@@ -56,8 +117,46 @@ def embTxtPrompts(prompts: list[str]) -> np.ndarray:
 
     return _normalize_embedding_batch(txtFeatures)
 
+# >> free text query -> embedding cache. keeps repeat searches off the text encoder.
+# called from threadpool workers, so reads / writes hold _txtQueryLock (the encoder call doesnt) <<
+_txtQueryCache: OrderedDict[str, np.ndarray] = OrderedDict()
+_txtQueryLock = threading.Lock()
+TXT_QUERY_CACHE_SIZE = 1024
+
+def embTxtQueriesCached(queries: list[str]) -> np.ndarray:
+    """
+    embed search queries; cached per query string.
+    all misses go through the text encoder in one batch"""
+
+    found: dict[str, np.ndarray] = {}
+
+    with _txtQueryLock:
+        for q in dict.fromkeys(queries):
+            if q in _txtQueryCache:
+                _txtQueryCache.move_to_end(q)
+                found[q] = _txtQueryCache[q]
+
+    missing = [q for q in dict.fromkeys(queries) if q not in found]
+
+    if missing:
+        embs = embTxtPrompts(missing)
+
+        with _txtQueryLock:
+            for q, emb in zip(missing, embs):
+                found[q] = emb
+                _txtQueryCache[q] = emb
+                _txtQueryCache.move_to_end(q)
+
+            while len(_txtQueryCache) > TXT_QUERY_CACHE_SIZE:
+                _txtQueryCache.popitem(last = False)
+
+    return np.stack([found[q] for q in queries], axis = 0)
+
 # >> convert PIL -> clip embedding vector <<<
 def EmbedPILImg(img: Image.Image) -> np.ndarray:
+    import torch
+    model, processor = modelGet()
+
     input = processor(images=img, return_tensors="pt")
     input =  {k: v.to(DEVICE) for k, v in input.items()}
 
@@ -66,6 +165,25 @@ def EmbedPILImg(img: Image.Image) -> np.ndarray:
 
     return _normalize_embedding(imgFeatures)
 
+# >> batched ver of above; one forward pass for many images <<
+def EmbedPILImgBatch(imgs: list[Image.Image]) -> np.ndarray:
+    """
+    convert list of PIL images -> (n, dim) normalised clip embeddings"""
+
+    if not imgs:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    import torch
+    model, processor = modelGet()
+
+    input = processor(images=imgs, return_tensors="pt")
+    input = {k: v.to(DEVICE) for k, v in input.items()}
+
+    with torch.no_grad():
+        imgFeatures = model.get_image_features(**input)
+
+    return _normalize_embedding_batch(imgFeatures)
+
 # >> pull image from url -> embed via clip. <<<
 def EmbedImgURL(url:str) -> np.ndarray:
     img = LoadImageViaURL(url)
@@ -178,19 +296,7 @@ def appNameGet(appid: int) -> str | None:
     """
     get appname from app_index"""
 
-    row = single_fetch(
-        """
-        SELECT name
-        FROM app_index
-        WHERE appid = ?
-        """,
-        (appid,)
-    )
-
-    if not row:
-        return None
-    
-    return row["name"]
+    return appNamesGet([appid]).get(appid)
 
 def appTxtPrompts(name : str) -> list[str]:
     """
@@ -288,6 +394,8 @@ def UpsertSSEmbedding(appid: int, url: str, embed: np.ndarray):
     add one screenshot embedding into sqlite
     """
 
+    global _ssIndexDirty
+
     ts = timestamp()
     exec("""
         INSERT INTO screenshot_embeddings (appid, url, embedding, dim, added_at)
@@ -305,6 +413,7 @@ def UpsertSSEmbedding(appid: int, url: str, embed: np.ndarray):
             ts,
         )
     )
+    _ssIndexDirty = True
 
 def GetSSEmbeddingStored(limit: int | None = None) -> list[dict]:
     """load stored embeddings form sqlite"""
@@ -332,9 +441,105 @@ def GetSSEmbeddingStored(limit: int | None = None) -> list[dict]:
 
     return results
 
+# >> in-process copy of screenshot_embeddings as one matrix.
+# rebuilt when rows are upserted or the table changes underneath us. <<
+_ssIndex: dict | None = None
+_ssIndexDirty = True
+
+def _ssIndexStamp() -> tuple:
+    row = single_fetch(
+        """
+        SELECT COUNT(*) AS count, MAX(added_at) AS added_at
+        FROM screenshot_embeddings
+        """
+    )
+    return (row["count"], row["added_at"]) if row else (0, None)
+
+def storedIndexGet() -> dict:
+    """
+    load all stored ss embeddings as arrays.
+    returns {"appids": (n,) int64, "urls": (n,) object, "embeds": (n, dim) float32}"""
+
+    global _ssIndex, _ssIndexDirty
+
+    stamp = _ssIndexStamp()
+    if _ssIndex is not None and not _ssIndexDirty and _ssIndex["stamp"] == stamp:
+        return _ssIndex
+
+    rows = GetSSEmbeddingStored()
+    dims = {len(r["embed"]) for r in rows}
+
+    # >> mixed dims would mean a model swap mid-table; keep the majority dim only <<
+    if len(dims) > 1:
+        dim = Counter(len(r["embed"]) for r in rows).most_common(1)[0][0]
+        rows = [r for r in rows if len(r["embed"]) == dim]
+
+    if rows:
+        embeds = np.stack([r["embed"] for r in rows], axis = 0).astype(np.float32)
+    else:
+        embeds = np.zeros((0, 0), dtype=np.float32)
+
+    _ssIndex = {
+        "appids": np.array([int(r["appid"]) for r in rows], dtype=np.int64),
+        "urls": np.array([r["url"] for r in rows], dtype=object),
+        "embeds": embeds,
+        "stamp": stamp,
+    }
+    _ssIndexDirty = False
+    return _ssIndex
+
+# >> per app centroid matrix for the whole index; rebuilt along with the index <<
+_appCentroids: dict | None = None
+
+def appCentroidMatrixGet() -> dict:
+    """
+    normalised centroid per appid for every app with stored embeddings.
+    returns {"appids": (n,) int64 sorted, "centroids": (n, dim) float32}"""
+
+    global _appCentroids
+
+    index = storedIndexGet()
+    # >> storedIndexGet hands back the same dict until it rebuilds <<
+    if _appCentroids is not None and _appCentroids["index"] is index:
+        return _appCentroids
+
+    appids = index["appids"]
+
+    if not len(appids):
+        _appCentroids = {"appids": appids, "centroids": index["embeds"], "index": index}
+        return _appCentroids
+
+    order = np.argsort(appids, kind="stable")
+    uniq, starts, counts = np.unique(appids[order], return_index = True, return_counts = True)
+
+    sums = np.add.reduceat(index["embeds"][order], starts, axis = 0)
+    centroids = sums / counts[:, None].astype(np.float32)
+
+    norms = np.linalg.norm(centroids, axis = 1, keepdims = True)
+    centroids = np.where(norms > 0, centroids / np.where(norms > 0, norms, 1), centroids)
+
+    _appCentroids = {"appids": uniq, "centroids": centroids.astype(np.float32), "index": index}
+    return _appCentroids
+
+def storedIndexState() -> dict:
+    return {
+        "loaded": _ssIndex is not None,
+        "rows": len(_ssIndex["urls"]) if _ssIndex is not None else 0,
+    }
+
+def findStoredTopMatchesBatch(queryEmbeds: np.ndarray, top_k: int = 20) -> list[list[dict]]:
+    """
+    search many queries against stored embeddings at once.
+    one (n, dim) x (dim, q) product; returns a match list per query"""
+
+    return [matchRowsGet(cols) for cols in findStoredTopMatchesArr(queryEmbeds, top_k = top_k)]
+
 def findStoredTopMatches(queryEmbed, top_k: int = 20, limit: int | None = None):
     """search from stored embeddings"""
 
+    if limit is None:
+        return findStoredTopMatchesBatch(queryEmbed, top_k = top_k)[0]
+
     rows  = GetSSEmbeddingStored(limit = limit)
     scored = []
 
@@ -481,10 +686,11 @@ def txtPromptRerank(queryEmb, appmatches: list[dict], sl_k: int = 15, bMax: floa
 
     prompts = []
     owners = []
+    names = appNamesGet([int(i["appid"]) for i in sl])
 
     for i in sl:
         appid = int(i["appid"])
-        name = appNameGet(appid)
+        name = names.get(appid)
 
         if not name:
             continue
@@ -544,6 +750,364 @@ def txtPromptRerank(queryEmb, appmatches: list[dict], sl_k: int = 15, bMax: floa
     reranked.sort(key = lambda x: x["finalScore"], reverse = True)
     return reranked
 
+# >>> array based rerank pipeline.
+# same stages + scores as the list versions above, but a match list is kept
+# as columns ({"appid": arr, "url": arr, "score": arr, ...}) the whole way
+# through. dicts are only built for the final rows via matchRowsGet. <<<
+
+def matchColsGet(matches: list[dict]) -> dict:
+    """
+    list of match dicts -> columns"""
+
+    return {
+        "appid": np.array([int(m["appid"]) for m in matches], dtype=np.int64),
+        "url": np.array([m["url"] for m in matches], dtype=object),
+        "score": np.array([float(m["score"]) for m in matches], dtype=np.float64),
+    }
+
+def matchRowsGet(cols: dict, n: int | None = None) -> list[dict]:
+    """
+    columns -> list of match dicts (first n rows only).
+    NaN marks a missing value and comes back as None"""
+
+    total = len(cols["appid"])
+    n = total if n is None else min(n, total)
+
+    rows = []
+
+    for i in range(n):
+        row = {}
+
+        for k, v in cols.items():
+            x = v[i]
+
+            if isinstance(x, np.integer):
+                x = int(x)
+            elif isinstance(x, np.floating):
+                x = None if np.isnan(x) else float(x)
+
+            row[k] = x
+
+        rows.append(row)
+
+    return rows
+
+def _colsTake(cols: dict, idx: np.ndarray) -> dict:
+    return {k: v[idx] for k, v in cols.items()}
+
+def _appidSegments(appids: np.ndarray, scores: np.ndarray):
+    """
+    group rows by appid.
+    returns (first, counts, rowOrder, starts):
+    - first -> first row index of each group (groups in np.unique order)
+    - rowOrder -> rows sorted by group, score desc, then original position
+    - starts -> where each group begins in rowOrder"""
+
+    m = len(appids)
+    _, first, inv, counts = np.unique(appids, return_index = True, return_inverse = True, return_counts = True)
+    rowOrder = np.lexsort((np.arange(m), -scores, inv))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    return first, counts, rowOrder, starts
+
+def _topRows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    indices of the top_k scores, best first; ties keep original row order"""
+
+    n = len(scores)
+    k = min(top_k, n)
+
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.lexsort((top, -scores[top]))]
+
+    return np.argsort(-scores, kind="stable")
+
+def findTopMatchesArr(queryEmbed, embeds: np.ndarray, top_k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+    """
+    top_k rows of embeds by similarity to the query.
+    one matrix-vector product; returns (row indices, scores) best first"""
+
+    if len(embeds) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    scores = (embeds @ np.asarray(queryEmbed, dtype=np.float32)).astype(np.float64)
+    top = _topRows(scores, top_k)
+
+    return top, scores[top]
+
+def findStoredTopMatchesArr(queryEmbeds: np.ndarray, top_k: int = 20) -> list[dict]:
+    """
+    stored index search returning columns; one block per query.
+    all queries are scored with one matrix-matrix product"""
+
+    queryEmbeds = np.atleast_2d(np.asarray(queryEmbeds, dtype=np.float32))
+    index = storedIndexGet()
+
+    if not len(index["urls"]):
+        return [matchColsGet([]) for _ in range(len(queryEmbeds))]
+
+    scores = (index["embeds"] @ queryEmbeds.T).astype(np.float64)
+    results = []
+
+    for q in range(scores.shape[1]):
+        top = _topRows(scores[:, q], top_k)
+        results.append({
+            "appid": index["appids"][top],
+            "url": index["urls"][top],
+            "score": scores[top, q],
+        })
+
+    return results
+
+def colMatchByAppidArr(cols: dict) -> dict:
+    """
+    colMatchByAppid on columns. best row per appid, best first"""
+
+    if not len(cols["appid"]):
+        return cols
+
+    first, counts, rowOrder, starts = _appidSegments(cols["appid"], cols["score"])
+    best = rowOrder[starts]
+
+    # >> groups in order of first appearance, then stable sort by score (same ties as list ver) <<
+    best = best[np.argsort(first, kind="stable")]
+    best = best[np.argsort(-cols["score"][best], kind="stable")]
+
+    return _colsTake(cols, best)
+
+def rerankASMultiArr(cols: dict) -> dict:
+    """
+    rerankASMulti on columns.
+    appScore per app from its top 3 screenshot scores (see appScoreMultiSS)"""
+
+    m = len(cols["appid"])
+    if not m:
+        return {**cols, "appScore": np.zeros(0), "match_count": np.zeros(0, dtype=np.int64)}
+
+    scores = cols["score"].astype(np.float64)
+    first, counts, rowOrder, starts = _appidSegments(cols["appid"], scores)
+    ranked = scores[rowOrder]
+
+    sc1 = ranked[starts]
+    sc2 = np.where(counts > 1, ranked[np.minimum(starts + 1, m - 1)], 0.0)
+    sc3 = np.where(counts > 2, ranked[np.minimum(starts + 2, m - 1)], 0.0)
+
+    bn1 = np.where(sc2 >= (sc1 - 0.03), sc2, 0.0)
+    bn2 = np.where(sc3 >= (sc1 - 0.05), sc3, 0.0)
+    appScore = sc1 + (0.15 * bn1) + (0.05 * bn2)
+
+    order = np.argsort(first, kind="stable")
+    order = order[np.argsort(-appScore[order], kind="stable")]
+    best = rowOrder[starts][order]
+
+    return {
+        "appid": cols["appid"][best],
+        "url": cols["url"][best],
+        "score": scores[best],
+        "appScore": appScore[order],
+        "match_count": counts[order].astype(np.int64),
+    }
+
+def centroidRerankerArr(queryEmb, cols: dict, sl_k: int = 15) -> dict:
+    """
+    centroidReranker on columns; centroid scores from one matrix product"""
+
+    sl = _colsTake(cols, np.arange(min(sl_k, len(cols["appid"]))))
+    appids = [int(a) for a in sl["appid"]]
+    centroids = buildAppCentroids(appids)
+
+    rScore = sl["score"].astype(np.float64)
+    mssScore = sl.get("appScore", sl["score"]).astype(np.float64)
+
+    hasCr = np.array([a in centroids for a in appids], dtype=bool)
+    crScore = np.full(len(appids), float("-inf"))
+
+    if hasCr.any():
+        C = np.stack([centroids[a] for a in appids if a in centroids], axis = 0)
+        crScore[hasCr] = (C @ np.asarray(queryEmb, dtype=C.dtype)).astype(np.float64)
+
+    gap = rScore - crScore
+    rawHeavy = gap >= 0.04
+
+    fScore = np.where(
+        rawHeavy,
+        (0.60 * rScore) + (0.30 * crScore) + (0.10 * mssScore),
+        (0.40 * rScore) + (0.45 * crScore) + (0.15 * mssScore),
+    )
+    fScore = np.where(hasCr, fScore, rScore)
+
+    bm = np.where(rawHeavy, "raw_heavy", "balanced_centroid").astype(object)
+    bm[~hasCr] = "raw_fallback"
+
+    out = dict(sl)
+    out["ssAppScore"] = mssScore
+    out["centroidScore"] = crScore
+    out["finalScore"] = fScore
+    out["appScore"] = fScore
+    out["blendMode"] = bm
+
+    return _colsTake(out, np.argsort(-fScore, kind="stable"))
+
+# >> prompt embeddings per app; names rarely change so these are reused across queries.
+# same locking as _txtQueryCache: the encoder runs outside _appPromptEmbLock <<
+_appPromptEmbCache: OrderedDict[int, tuple[str, np.ndarray]] = OrderedDict()
+_appPromptEmbLock = threading.Lock()
+APP_PROMPT_CACHE_SIZE = 4096
+
+def appPromptEmbGet(names: dict[int, str]) -> dict[int, np.ndarray]:
+    """
+    (n_prompts, dim) prompt embeddings per appid.
+    all misses are encoded in one text encoder pass"""
+
+    out: dict[int, np.ndarray] = {}
+
+    with _appPromptEmbLock:
+        for appid, name in names.items():
+            hit = _appPromptEmbCache.get(appid)
+            if hit is not None and hit[0] == name:
+                _appPromptEmbCache.move_to_end(appid)
+                out[appid] = hit[1]
+
+    missing = [appid for appid in names if appid not in out]
+
+    if missing:
+        prompts = [pr for appid in missing for pr in appTxtPrompts(names[appid])]
+        txtEmb = embTxtPrompts(prompts)
+        n = len(txtEmb) // len(missing)
+
+        with _appPromptEmbLock:
+            for i, appid in enumerate(missing):
+                out[appid] = txtEmb[i * n:(i + 1) * n]
+                _appPromptEmbCache[appid] = (names[appid], out[appid])
+                _appPromptEmbCache.move_to_end(appid)
+
+            while len(_appPromptEmbCache) > APP_PROMPT_CACHE_SIZE:
+                _appPromptEmbCache.popitem(last = False)
+
+    return {appid: out[appid] for appid in names}
+
+def txtPromptRerankArr(queryEmb, cols: dict, sl_k: int = 15, bMax: float = 0.04) -> dict:
+    """
+    txtPromptRerank on columns; text scores from one matrix product"""
+
+    sl = [int(a) for a in cols["appid"][:sl_k]]
+    names = appNamesGet(sl)
+
+    # >> return original matches if no prompts are able to be built <<
+    if not names:
+        return cols
+
+    promptEmb = appPromptEmbGet(names)
+    appids = list(promptEmb.keys())
+
+    P = np.stack([promptEmb[a] for a in appids], axis = 0)
+    S = (P @ np.asarray(queryEmb, dtype=P.dtype)).astype(np.float64)
+
+    # >> txtScoreAgg -> 0.7 * best + 0.3 * second best prompt <<
+    S = -np.sort(-S, axis = 1)
+    agg = S[:, 0] if S.shape[1] == 1 else (0.70 * S[:, 0]) + (0.30 * S[:, 1])
+
+    minTxt = agg.min()
+    dn = agg.max() - minTxt
+
+    pos = {a: i for i, a in enumerate(appids)}
+    txtScore = np.array([agg[pos[a]] if a in pos else np.nan for a in cols["appid"]], dtype=np.float64)
+
+    if "finalScore" in cols:
+        vScore = cols["finalScore"].astype(np.float64)
+    elif "appScore" in cols:
+        vScore = cols["appScore"].astype(np.float64)
+    else:
+        vScore = cols["score"].astype(np.float64)
+
+    # >> txtScoreN makes it so text can be compared within current shortlist <<
+    if dn == 0:
+        txtScoreN = np.zeros(len(txtScore))
+    else:
+        txtScoreN = np.where(np.isnan(txtScore), 0.0, (txtScore - minTxt) / dn)
+
+    fScore = vScore + (txtScoreN * bMax)
+
+    out = dict(cols)
+    out["preTextScore"] = vScore
+    out["textScore"] = txtScore
+    out["textScoreNorm"] = txtScoreN
+    out["finalScore"] = fScore
+    out["appScore"] = fScore
+    out["rerankStage"] = np.full(len(fScore), "text_prompt", dtype=object)
+
+    return _colsTake(out, np.argsort(-fScore, kind="stable"))
+
+# >> the Arr stages reproduce the list stages' grouping, ties and blend
+# arithmetic, but similarities come from BLAS matrix products instead of
+# per-pair np.dot, so float32 sums can differ in the last bits.
+# scores are equal up to PARITY_ATOL; near-ties inside that can swap places. <<
+PARITY_ATOL = 1e-5
+
+def rerankParityCheck(queryEmb, ss_k: int = 250, sl_k: int = 15, atol: float = PARITY_ATOL) -> dict:
+    """
+    run the list and Arr pipelines on the same query + stored index and
+    compare them app by app"""
+
+    ssList = findStoredTopMatches(queryEmb, top_k = ss_k)
+    ssCols = findStoredTopMatchesArr(queryEmb, top_k = ss_k)[0]
+
+    listRows = txtPromptRerank(queryEmb, centroidReranker(queryEmb, rerankASMulti(ssList), sl_k = sl_k), sl_k = sl_k)
+    arrRows = matchRowsGet(txtPromptRerankArr(queryEmb, centroidRerankerArr(queryEmb, rerankASMultiArr(ssCols), sl_k = sl_k), sl_k = sl_k))
+
+    byAppid = {int(r["appid"]): r for r in arrRows}
+    sameApps = sorted(byAppid) == sorted(int(r["appid"]) for r in listRows)
+    maxDiff = 0.0
+
+    for r in listRows:
+        other = byAppid.get(int(r["appid"]))
+        if other is None:
+            continue
+
+        for k in ("score", "appScore", "ssAppScore", "centroidScore", "finalScore", "textScore"):
+            a, b = r.get(k), other.get(k)
+            if a is None or b is None or not np.isfinite(a) or not np.isfinite(b):
+                continue
+            maxDiff = max(maxDiff, abs(float(a) - float(b)))
+
+    return {
+        "ok": sameApps and maxDiff <= atol,
+        "same_apps": sameApps,
+        "same_order": [int(r["appid"]) for r in listRows] == [int(r["appid"]) for r in arrRows],
+        "max_abs_diff": maxDiff,
+        "atol": atol,
+        "apps": len(listRows),
+    }
+
+def searchTxtQueries(queries: list[str], top_k: int = 10, ss_k: int = 250) -> list[dict]:
+    """
+    text -> screenshot search.
+    same top-k + appid collapse as image search; one result block per query"""
+
+    if not queries:
+        return []
+
+    queryEmbs = embTxtQueriesCached(queries)
+    ssMatchesAll = findStoredTopMatchesArr(queryEmbs, top_k = ss_k)
+
+    results = []
+
+    for q, ssMatches in zip(queries, ssMatchesAll):
+        appMatches = matchRowsGet(rerankASMultiArr(ssMatches), top_k)
+
+        names = appNamesGet([int(m["appid"]) for m in appMatches])
+        for m in appMatches:
+            m["name"] = names.get(int(m["appid"]))
+
+        results.append({
+            "query": q,
+            "searched_rows": len(storedIndexGet()["urls"]),
+            "matches": appMatches,
+        })
+
+    return results
+
 def findMissingEmb(limit: int | None = 200, appid: int | None = None) -> list[dict]:
     """
     should process rows that are missing
@@ -0,0 +1,266 @@
+import math
+import numpy as np
+
+from itertools import permutations
+from db import all_fetch, get_connection
+
+# >>> item-item co-ownership index ("players like you also play").
+# each user contributes their top played games, weighted log1p(playtime).
+#   item_cooc.dot   -> sum over users of w_a * w_b
+#   item_norms.sq   -> sum over users of w_a ^ 2
+#   sim(a, b)       -> dot / sqrt(sq_a * sq_b)   (cosine, so popular games dont dominate)
+# user_cooc_contrib remembers what each user last added so a resync only
+# applies the difference. <<<
+
+COOC_TOP_N = 50
+COOC_MIN_MINS = 30
+COOC_NEIGHBORS = 50
+COOC_BLEND = 0.25
+
+def _rowsFetch(connection, query: str, params: tuple = ()) -> list:
+    if connection is None:
+        return all_fetch(query, params)
+    return connection.execute(query, params).fetchall()
+
+def userContribGet(steamid64: str, TopGames_n: int = COOC_TOP_N, connection = None) -> dict[int, float]:
+    """
+    the weights a user should currently contribute (from owned_games)"""
+
+    rows = _rowsFetch(
+        connection,
+        """
+        SELECT appid, pt_forever_min
+        FROM owned_games
+        WHERE steamid64 = ? AND pt_forever_min >= ?
+        ORDER BY pt_forever_min DESC
+        LIMIT ?
+        """,
+        (steamid64, COOC_MIN_MINS, TopGames_n)
+    )
+    return {int(r["appid"]): math.log1p(int(r["pt_forever_min"])) for r in rows}
+
+def _storedContribGet(steamid64: str, connection = None) -> dict[int, float]:
+    rows = _rowsFetch(connection, "SELECT appid, weight FROM user_cooc_contrib WHERE steamid64 = ?", (steamid64,))
+    return {int(r["appid"]): float(r["weight"]) for r in rows}
+
+def _pairDeltas(old: dict[int, float], new: dict[int, float]) -> tuple[dict, dict]:
+    """
+    (pair -> change in dot, item -> change in sq) going from old to new"""
+
+    pairs: dict[tuple[int, int], float] = {}
+    norms: dict[int, float] = {}
+
+    for contrib, sign in ((old, -1.0), (new, 1.0)):
+        for a, b in permutations(contrib, 2):
+            pairs[(a, b)] = pairs.get((a, b), 0.0) + sign * contrib[a] * contrib[b]
+        for a, w in contrib.items():
+            norms[a] = norms.get(a, 0.0) + sign * w * w
+
+    return pairs, norms
+
+def _neighborsRefresh(connection, appids: list[int], k: int = COOC_NEIGHBORS) -> None:
+    """
+    recompute the stored top k neighbours of the given apps"""
+
+    for a in appids:
+        rows = connection.execute(
+            """
+            SELECT c.appid_b AS appid, c.dot AS dot, nb.sq AS sq_b, na.sq AS sq_a
+            FROM item_cooc c
+            JOIN item_norms na ON na.appid = c.appid_a
+            JOIN item_norms nb ON nb.appid = c.appid_b
+            WHERE c.appid_a = ?
+            """,
+            (a,)
+        ).fetchall()
+
+        sims = [
+            (int(r["appid"]), float(r["dot"]) / math.sqrt(float(r["sq_a"]) * float(r["sq_b"])))
+            for r in rows
+            if r["sq_a"] > 0 and r["sq_b"] > 0
+        ]
+        sims.sort(key = lambda x: (-x[1], x[0]))
+
+        connection.execute("DELETE FROM item_neighbors WHERE appid = ?", (a,))
+        connection.executemany(
+            "INSERT INTO item_neighbors (appid, rank, neighbor, score) VALUES (?, ?, ?, ?)",
+            [(a, rank, nb, sim) for rank, (nb, sim) in enumerate(sims[:k], start = 1)],
+        )
+
+def coocUserUpdate(steamid64: str) -> dict:
+    """
+    apply one users library change to the index.
+    only the users own pairs are touched; neighbour lists are refreshed for
+    those apps + any app currently listing one of them.
+    (anything else picks up the norm change next time its refreshed, or on coocRebuild)"""
+
+    # >> read, delta and write in one write transaction so concurrent syncs of
+    # the same user (or a rebuild) can't apply the same delta twice <<
+    connection = get_connection()
+    connection.execute("BEGIN IMMEDIATE")
+
+    old = _storedContribGet(steamid64, connection)
+    new = userContribGet(steamid64, connection = connection)
+
+    if old == new:
+        connection.rollback()
+        connection.close()
+        return {"steamid64": steamid64, "changed": False, "pairs": 0, "apps": 0}
+
+    pairs, norms = _pairDeltas(old, new)
+    pairs = {p: d for p, d in pairs.items() if d != 0.0}
+    affected = sorted(set(old) | set(new))
+
+    connection.executemany(
+        """
+        INSERT INTO item_cooc (appid_a, appid_b, dot) VALUES (?, ?, ?)
+        ON CONFLICT(appid_a, appid_b) DO UPDATE SET dot = dot + excluded.dot
+        """,
+        [(a, b, d) for (a, b), d in pairs.items()],
+    )
+    connection.executemany(
+        """
+        INSERT INTO item_norms (appid, sq) VALUES (?, ?)
+        ON CONFLICT(appid) DO UPDATE SET sq = sq + excluded.sq
+        """,
+        list(norms.items()),
+    )
+
+    # >> float leftovers from removed libraries; only the rows touched here <<
+    connection.executemany(
+        "DELETE FROM item_cooc WHERE appid_a = ? AND appid_b = ? AND dot <= 1e-9",
+        list(pairs),
+    )
+    connection.executemany(
+        "DELETE FROM item_norms WHERE appid = ? AND sq <= 1e-9",
+        [(a,) for a in norms],
+    )
+
+    connection.execute("DELETE FROM user_cooc_contrib WHERE steamid64 = ?", (steamid64,))
+    connection.executemany(
+        "INSERT INTO user_cooc_contrib (steamid64, appid, weight) VALUES (?, ?, ?)",
+        [(steamid64, a, w) for a, w in new.items()],
+    )
+
+    ph = ",".join("?" for _ in affected)
+    listing = connection.execute(
+        f"SELECT DISTINCT appid FROM item_neighbors WHERE neighbor IN ({ph})",
+        tuple(affected)
+    ).fetchall()
+    refresh = sorted(set(affected) | {int(r["appid"]) for r in listing})
+
+    _neighborsRefresh(connection, refresh)
+    connection.commit()
+    connection.close()
+
+    return {"steamid64": steamid64, "changed": True, "pairs": len(pairs), "apps": len(affected), "refreshed": len(refresh)}
+
+def coocRebuild() -> dict:
+    """
+    rebuild the whole index from owned_games (drift cleanup / first run)"""
+
+    connection = get_connection()
+    connection.execute("BEGIN IMMEDIATE")
+
+    users = [r["steamid64"] for r in connection.execute("SELECT DISTINCT steamid64 FROM owned_games")]
+
+    pairs: dict[tuple[int, int], float] = {}
+    norms: dict[int, float] = {}
+    contribs = []
+
+    for sid in users:
+        contrib = userContribGet(sid, connection = connection)
+        p, n = _pairDeltas({}, contrib)
+
+        for key, d in p.items():
+            pairs[key] = pairs.get(key, 0.0) + d
+        for key, d in n.items():
+            norms[key] = norms.get(key, 0.0) + d
+
+        contribs.extend((sid, a, w) for a, w in contrib.items())
+
+    for table in ("item_cooc", "item_norms", "item_neighbors", "user_cooc_contrib"):
+        connection.execute(f"DELETE FROM {table}")
+
+    connection.executemany("INSERT INTO item_cooc (appid_a, appid_b, dot) VALUES (?, ?, ?)", [(a, b, d) for (a, b), d in pairs.items()])
+    connection.executemany("INSERT INTO item_norms (appid, sq) VALUES (?, ?)", list(norms.items()))
+    connection.executemany("INSERT INTO user_cooc_contrib (steamid64, appid, weight) VALUES (?, ?, ?)", contribs)
+
+    _neighborsRefresh(connection, sorted(norms))
+    connection.commit()
+    connection.close()
+
+    return {"users": len(users), "apps": len(norms), "pairs": len(pairs)}
+
+def coocScoresGet(steamid64: str, exclude: set[int] | None = None) -> dict[int, tuple[float, str]]:
+    """
+    "also play" scores for one user from the precomputed neighbour lists.
+    appid -> (score, name of the owned app contributing most)"""
+
+    contrib = _storedContribGet(steamid64) or userContribGet(steamid64)
+    if not contrib:
+        return {}
+
+    ph = ",".join("?" for _ in contrib)
+    rows = all_fetch(
+        f"""
+        SELECT appid, neighbor, score
+        FROM item_neighbors
+        WHERE appid IN ({ph})
+        """,
+        tuple(contrib)
+    )
+
+    exclude = exclude or set()
+    scores: dict[int, float] = {}
+    best: dict[int, tuple[float, int]] = {}
+
+    for r in rows:
+        nb = int(r["neighbor"])
+        if nb in exclude or nb in contrib:
+            continue
+
+        part = contrib[int(r["appid"])] * float(r["score"])
+        scores[nb] = scores.get(nb, 0.0) + part
+
+        if nb not in best or part > best[nb][0]:
+            best[nb] = (part, int(r["appid"]))
+
+    names = {
+        int(r["appid"]): r["name"] or str(r["appid"])
+        for r in all_fetch(
+            f"SELECT appid, name FROM owned_games WHERE steamid64 = ? AND appid IN ({ph})",
+            (steamid64, *contrib)
+        )
+    }
+
+    return {nb: (s, names.get(best[nb][1], str(best[nb][1]))) for nb, s in scores.items()}
+
+def coocBlend(scores: np.ndarray, appids: np.ndarray, cf: dict[int, tuple[float, str]], weight: float = COOC_BLEND) -> None:
+    """
+    add co-ownership scores onto catalogue scores (in place).
+    cf is rescaled so its best app is worth weight * the best content score"""
+
+    if not cf:
+        return
+
+    finite = scores[np.isfinite(scores)]
+    top = float(finite.max()) if len(finite) else 0.0
+    cfMax = max(s for s, _ in cf.values())
+
+    if top <= 0 or cfMax <= 0:
+        return
+
+    ids = np.fromiter(cf.keys(), dtype=np.int64)
+    vals = np.fromiter((s for s, _ in cf.values()), dtype=np.float64)
+
+    pos = np.minimum(np.searchsorted(appids, ids), len(appids) - 1)
+    hit = appids[pos] == ids
+
+    scores[pos[hit]] += weight * (top / cfMax) * vals[hit]
+
+def coocReasonGet(cf: dict[int, tuple[float, str]], appid: int) -> str | None:
+    if appid not in cf:
+        return None
+
+    return f"Players who play {cf[appid][1]} also play this"
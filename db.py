@@ -1,3 +1,4 @@
+import json
 import sqlite3
 import time
 
@@ -40,13 +41,51 @@ def dbInitiate() -> None:
         """
     )
 
+    # >> /me/owned-games reads a users library top-down by playtime <<
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_owned_games_playtime ON owned_games (steamid64, pt_forever_min DESC)")
+
     # >>> cached store metadeta. <<<
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS app_details (
             appid INTEGER PRIMARY KEY,
             json TEXT NOT NULL,
-            fetched_at INTEGER NOT NULL
+            fetched_at INTEGER NOT NULL,
+            reads INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+
+    # >> appids the store couldnt give us details for. transient = 1 for
+    # 429 / 5xx / network errors, 0 for success:false (delisted, region locked..) <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_details_failures (
+            appid INTEGER PRIMARY KEY,
+            reason TEXT NOT NULL,
+            transient INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            failed_at INTEGER NOT NULL
+        );
+        """
+    )
+
+    # >> resumable catalogue ingest (catalog.py). one row per source;
+    # last_appid is the highest appid whose details are done this run <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalog_checkpoints (
+            name TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            last_appid INTEGER NOT NULL DEFAULT 0,
+            since INTEGER NOT NULL DEFAULT 0,
+            seen INTEGER NOT NULL DEFAULT 0,
+            queued INTEGER NOT NULL DEFAULT 0,
+            fetched INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            finished_at INTEGER
         );
         """
     )
@@ -63,6 +102,9 @@ def dbInitiate() -> None:
         """
     )
 
+    # >> MAX(updated_at) is the change stamp appmeta / appmatrix check; keeps it an index lookup <<
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_app_index_updated ON app_index (updated_at)")
+
     # >> table to store screenshots. to be used as a registry for the image dataset. <<
     cursor.execute(
         """
@@ -88,6 +130,172 @@ def dbInitiate() -> None:
         """
     )
 
+    # >> normalised genres / categories. integer coded vocab + (appid, label) rows,
+    # indexed by label so candidate generation can stay in sql.
+    # pos keeps the order steam lists them in. <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS genre_vocab (
+        genre_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS category_vocab (
+        category_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_genres (
+        appid INTEGER NOT NULL,
+        genre_id INTEGER NOT NULL,
+        pos INTEGER NOT NULL,
+        PRIMARY KEY (appid, genre_id)
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_categories (
+        appid INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        pos INTEGER NOT NULL,
+        PRIMARY KEY (appid, category_id)
+        );
+        """
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_app_genres_genre ON app_genres (genre_id, appid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_app_categories_category ON app_categories (category_id, appid)")
+
+    # >> cached user profiles (weighted genre / category counters as json).
+    # last_synced (users.owned_changed_at) + meta_updated_at are the library / app_index stamps they were built from. <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+        steamid64 TEXT PRIMARY KEY,
+        genres TEXT NOT NULL,
+        categories TEXT NOT NULL,
+        last_synced INTEGER,
+        meta_updated_at INTEGER,
+        built_at INTEGER NOT NULL
+        );
+        """
+    )
+
+    # >> precomputed top-k recommendations per user (see batchrec.py) <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS recommendations (
+        steamid64 TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        appid INTEGER NOT NULL,
+        score REAL NOT NULL,
+        computed_at INTEGER NOT NULL,
+        PRIMARY KEY (steamid64, rank)
+        );
+        """
+    )
+
+    # >> item-item co-ownership index (see cooc.py) <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS item_cooc (
+        appid_a INTEGER NOT NULL,
+        appid_b INTEGER NOT NULL,
+        dot REAL NOT NULL,
+        PRIMARY KEY (appid_a, appid_b)
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS item_norms (
+        appid INTEGER PRIMARY KEY,
+        sq REAL NOT NULL
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS item_neighbors (
+        appid INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (appid, rank)
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_cooc_contrib (
+        steamid64 TEXT NOT NULL,
+        appid INTEGER NOT NULL,
+        weight REAL NOT NULL,
+        PRIMARY KEY (steamid64, appid)
+        );
+        """
+    )
+
+    # >> per user "visual taste": playtime weighted mean of their top games centroids <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_visual_taste (
+        steamid64 TEXT PRIMARY KEY,
+        embedding BLOB NOT NULL,
+        dim INTEGER NOT NULL,
+        app_count INTEGER NOT NULL,
+        last_synced INTEGER,
+        built_at INTEGER NOT NULL
+        );
+        """
+    )
+
+    # >> visual similar-games graph: top k neighbours per app by centroid cosine.
+    # app_visual_centroids keeps the centroid each list was built from so
+    # updates only touch apps whose centroid actually moved <<
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_visual_neighbors (
+        appid INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (appid, rank)
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_app_visual_neighbors_neighbor
+        ON app_visual_neighbors (neighbor);
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_visual_centroids (
+        appid INTEGER PRIMARY KEY,
+        embedding BLOB NOT NULL,
+        dim INTEGER NOT NULL,
+        built_at INTEGER NOT NULL
+        );
+        """
+    )
+
     # Migrate older DBs that were created before the embedding dimension column
     # existed so stored vectors can be reconstructed correctly.
     columns = {
@@ -105,9 +313,93 @@ def dbInitiate() -> None:
         """
     )
 
+    # >> read counter for the appdetails refresh scheduler (refresher.py) <<
+    columns = {
+        row["name"]
+        for row in connection.execute("PRAGMA table_info(app_details)").fetchall()
+    }
+    if "reads" not in columns:
+        cursor.execute("ALTER TABLE app_details ADD COLUMN reads INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_app_details_fetched ON app_details (fetched_at)")
+
+    # >> k the visual similar-games lists were last rebuilt with; incremental updates reuse it <<
+    columns = {
+        row["name"]
+        for row in connection.execute("PRAGMA table_info(app_visual_centroids)").fetchall()
+    }
+    if "k" not in columns:
+        cursor.execute("ALTER TABLE app_visual_centroids ADD COLUMN k INTEGER")
+        cursor.execute("UPDATE app_visual_centroids SET k = (SELECT MAX(rank) FROM app_visual_neighbors)")
+
+    # >> when the users library was last synced; owned_games.last_synced only moves on rows that changed <<
+    columns = {
+        row["name"]
+        for row in connection.execute("PRAGMA table_info(users)").fetchall()
+    }
+    if "owned_synced_at" not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN owned_synced_at INTEGER")
+        cursor.execute(
+            """
+            UPDATE users
+            SET owned_synced_at = (SELECT MAX(last_synced) FROM owned_games WHERE owned_games.steamid64 = users.steamid64)
+            """
+        )
+
+    # >> when the library last actually changed (games added, updated or removed).
+    # cached profiles / taste vectors are stamped with this, so removals invalidate them too <<
+    if "owned_changed_at" not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN owned_changed_at INTEGER")
+        cursor.execute(
+            """
+            UPDATE users
+            SET owned_changed_at = (SELECT MAX(last_synced) FROM owned_games WHERE owned_games.steamid64 = users.steamid64)
+            """
+        )
+
+    # >> backfill normalised labels for apps indexed before the tables existed <<
+    rows = connection.execute(
+        """
+        SELECT appid, genres, categories
+        FROM app_index
+        WHERE appid NOT IN (SELECT appid FROM app_genres)
+        AND appid NOT IN (SELECT appid FROM app_categories)
+        AND (COALESCE(genres, '[]') != '[]' OR COALESCE(categories, '[]') != '[]')
+        """
+    ).fetchall()
+
+    for r in rows:
+        appLabelsWrite(
+            connection,
+            int(r["appid"]),
+            json.loads(r["genres"] or "[]"),
+            json.loads(r["categories"] or "[]"),
+        )
+
     connection.commit()
     connection.close()
 
+def appLabelsWrite(connection: sqlite3.Connection, appid: int, genres: list[str], categories: list[str]) -> None:
+    """
+    replace the app_genres / app_categories rows of one app.
+    caller commits (so it can share a transaction with the app_index write)"""
+
+    for table, vocab, idCol, labels in (
+        ("app_genres", "genre_vocab", "genre_id", genres),
+        ("app_categories", "category_vocab", "category_id", categories),
+    ):
+        connection.execute(f"DELETE FROM {table} WHERE appid = ?", (appid,))
+
+        for pos, label in enumerate(labels):
+            connection.execute(f"INSERT OR IGNORE INTO {vocab} (name) VALUES (?)", (label,))
+            connection.execute(
+                f"""
+                INSERT OR IGNORE INTO {table} (appid, {idCol}, pos)
+                SELECT ?, {idCol}, ? FROM {vocab} WHERE name = ?
+                """,
+                (appid, pos, label),
+            )
+
 # >>> gets current unix timestamp (s). <<<
 def timestamp() -> int:
     return int(time.time())
@@ -1,27 +1,70 @@
-from db import exec, timestamp
+import os
+import asyncio
+
+from db import exec, timestamp, get_connection
 from steamdata import f_owned
+from cooc import coocUserUpdate
+from visualtaste import userVisualTasteBuild
+
+# >> libraries older than this get re-synced in the background when read <<
+OWNED_STALE_SEC = int(os.getenv("OWNED_STALE_SEC", str(6 * 3600)))
+
+_resyncTasks: dict[str, asyncio.Task] = {}
+
+def ownedDiff(existing: dict[int, tuple], games: list[dict]) -> tuple[list, list, list]:
+    """
+    (added, updated, removed) between stored rows {appid: (name, minutes)}
+    and a fresh steam library"""
+
+    fresh = {}
+    for i in games:
+        if i.get("appid") is None:
+            continue
+        fresh[int(i["appid"])] = (i.get("name"), int(i.get("playtime_forever", 0)))
+
+    added = sorted(a for a in fresh if a not in existing)
+    updated = sorted(a for a in fresh if a in existing and fresh[a] != existing[a])
+    removed = sorted(a for a in existing if a not in fresh)
+
+    return [(a, *fresh[a]) for a in added], [(a, *fresh[a]) for a in updated], removed
 
 async def dbsync_owned(steamid64: str) -> dict:
     """
     fetch owned games via steam api;
-    store in sqlite
+    store in sqlite as a diff against what we had (one transaction).
+    only a real change moves users.owned_changed_at, so unchanged libraries
+    keep their cached profiles / taste vectors
 
     """
     ts = timestamp()
 
-    exec(
-        """
-    INSERT INTO users(steamid64, created_at)
-    VALUES (?, ?)
-    ON CONFLICT(steamid64) DO NOTHING;
-        """,
-        [steamid64, ts]
-    )
-
     games = await f_owned(steamid64)
 
-    for i in games:
-        exec(
+    connection = get_connection()
+    try:
+        connection.execute(
+            """
+        INSERT INTO users(steamid64, created_at)
+        VALUES (?, ?)
+        ON CONFLICT(steamid64) DO NOTHING;
+            """,
+            (steamid64, ts)
+        )
+
+        existing = {
+            int(r["appid"]): (r["name"], int(r["pt_forever_min"]))
+            for r in connection.execute(
+                "SELECT appid, name, pt_forever_min FROM owned_games WHERE steamid64 = ?", (steamid64,)
+            )
+        }
+
+        added, updated, removed = ownedDiff(existing, games)
+
+        # >> an empty reply is usually a private profile, not an empty library <<
+        if not games:
+            removed = []
+
+        connection.executemany(
             """
         INSERT INTO owned_games (steamid64, appid, name, pt_forever_min, last_synced)
         VALUES (?, ?, ?, ?, ?)
@@ -30,12 +73,148 @@ async def dbsync_owned(steamid64: str) -> dict:
         pt_forever_min = excluded.pt_forever_min,
         last_synced = excluded.last_synced
             """,
-        (
-            steamid64, 
-             int(i.get("appid")), 
-             i.get("name"), 
-             int(i.get("playtime_forever", 0)), 
-             ts,
-        ),)
-
-    return {"steamid64": steamid64, "synced-games": len(games), "last-synced": ts}
\ No newline at end of file
+            [(steamid64, a, name, mins, ts) for a, name, mins in added + updated]
+        )
+        connection.executemany(
+            "DELETE FROM owned_games WHERE steamid64 = ? AND appid = ?",
+            [(steamid64, a) for a in removed]
+        )
+
+        changes = {
+            "added": [a for a, _, _ in added],
+            "updated": [a for a, _, _ in updated],
+            "removed": removed,
+        }
+        changed = any(changes.values())
+
+        # >> owned_changed_at is the stamp cached profiles / taste vectors are checked against;
+        # set on the first sync even if it found nothing (private profile) <<
+        connection.execute(
+            """
+            UPDATE users
+            SET owned_synced_at = ?, owned_changed_at = CASE WHEN ? THEN ? ELSE COALESCE(owned_changed_at, ?) END
+            WHERE steamid64 = ?
+            """,
+            (ts, int(changed), ts, ts, steamid64)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+    # >> targeted invalidation; an unchanged library leaves every cache alone <<
+    if changed:
+        exec("DELETE FROM recommendations WHERE steamid64 = ?", (steamid64,))
+        await asyncio.to_thread(coocUserUpdate, steamid64)
+        # >> loads the centroid matrix on first use; keep it off the event loop <<
+        await asyncio.to_thread(userVisualTasteBuild, steamid64)
+
+    return {
+        "steamid64": steamid64,
+        "synced-games": len(games),
+        "last-synced": ts,
+        "changed": changed,
+        "changes": changes,
+        "empty-reply": not games,
+    }
+
+def _resyncTaskGet(steamid64: str) -> tuple[asyncio.Task, bool]:
+    """
+    the running sync for this user, or a new one; (task, started here)"""
+
+    task = _resyncTasks.get(steamid64)
+    if task is not None and not task.done():
+        return task, False
+
+    task = asyncio.create_task(dbsync_owned(steamid64))
+    _resyncTasks[steamid64] = task
+
+    def done(t: asyncio.Task):
+        if _resyncTasks.get(steamid64) is t:
+            del _resyncTasks[steamid64]
+        if not t.cancelled() and t.exception() is not None:
+            print(f"Warning: owned sync failed for {steamid64}: {t.exception()}")
+
+    task.add_done_callback(done)
+    return task, True
+
+def dbsync_owned_background(steamid64: str) -> bool:
+    """
+    kick off a sync without waiting on it; one per user at a time.
+    returns False if one was already running"""
+
+    return _resyncTaskGet(steamid64)[1]
+
+async def dbsync_owned_shared(steamid64: str) -> dict:
+    """
+    sync and wait; joins the users running sync instead of starting a second one.
+    shielded so a dropped request doesn't cancel it for everyone else"""
+
+    task, _ = _resyncTaskGet(steamid64)
+    return await asyncio.shield(task)
+
+def dbsync_owned_pending(steamid64: str) -> bool:
+    task = _resyncTasks.get(steamid64)
+    return task is not None and not task.done()
+
+async def ownedStampCheck(steamid64: str = "76561197960265728") -> None:
+    """
+    first sync -> add -> removal -> unchanged against the steam stand-in.
+    owned_changed_at has to be set by the first sync (even an empty reply),
+    move on the add and the removal, and stay put on the unchanged sync"""
+
+    import db
+    import tempfile
+    import steamdata
+
+    from pathlib import Path
+    from catalog import standInStart
+
+    recording = {"owned": {steamid64: []}}
+    server, base = standInStart(recording)
+    steamdata.STEAM_API_BASE = base
+
+    def stampsGet() -> tuple:
+        row = db.single_fetch("SELECT owned_synced_at, owned_changed_at FROM users WHERE steamid64 = ?", (steamid64,))
+        return row["owned_synced_at"], row["owned_changed_at"]
+
+    def step(games: list[dict]) -> None:
+        recording["owned"][steamid64] = games
+        # >> park the stamp on 0 so a move is visible within the same second <<
+        exec("UPDATE users SET owned_changed_at = 0 WHERE steamid64 = ?", (steamid64,))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.db_path = Path(tmp) / "check.sqlite3"
+            db.dbInitiate()
+
+            res = await dbsync_owned(steamid64)
+            synced, changedAt = stampsGet()
+            assert res["empty-reply"] and not res["changed"], res
+            assert synced == res["last-synced"] and changedAt == synced, (synced, changedAt)
+
+            games = [
+                {"appid": 10, "name": "Counter-Strike", "playtime_forever": 600},
+                {"appid": 20, "name": "Team Fortress Classic", "playtime_forever": 45},
+            ]
+
+            step(games)
+            res = await dbsync_owned(steamid64)
+            assert res["changes"]["added"] == [10, 20], res
+            assert stampsGet()[1] == res["last-synced"], "add did not move owned_changed_at"
+
+            step(games[:1])
+            res = await dbsync_owned(steamid64)
+            assert res["changes"]["removed"] == [20], res
+            assert stampsGet()[1] == res["last-synced"], "removal did not move owned_changed_at"
+
+            step(games[:1])
+            res = await dbsync_owned(steamid64)
+            assert not res["changed"], res
+            assert stampsGet() == (res["last-synced"], 0), "unchanged sync moved owned_changed_at"
+    finally:
+        server.shutdown()
+
+    print("owned stamp check ok")
+
+if __name__ == "__main__":
+    asyncio.run(ownedStampCheck())
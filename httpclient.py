@@ -0,0 +1,92 @@
+import os
+import asyncio
+import importlib.util
+import httpx
+
+from urllib.parse import urlsplit
+
+# >>> one pooled async client for every outbound steam call.
+# started / closed in main.py's lifespan; scripts that never run the app
+# (batch jobs, bench) get one lazily. keeps connections warm across calls
+# so bulk indexing doesnt redo tcp + tls per request. <<<
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# >> "auto" -> http/2 when the h2 package is installed <<
+HTTP2_MODE = os.getenv("HTTP2", "auto").lower()
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# >> per host; store appdetails is the slow + flaky one <<
+HOST_TIMEOUTS: dict[str, httpx.Timeout] = {
+    "api.steampowered.com": httpx.Timeout(20.0, connect=5.0),
+    "store.steampowered.com": httpx.Timeout(30.0, connect=5.0),
+    "steamcommunity.com": httpx.Timeout(15.0, connect=5.0),
+}
+
+_client: httpx.AsyncClient | None = None
+_clientLoop: asyncio.AbstractEventLoop | None = None
+
+def http2Enabled() -> bool:
+    if HTTP2_MODE in ("0", "false", "off"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+def timeoutFor(url: str) -> httpx.Timeout:
+    return HOST_TIMEOUTS.get(urlsplit(url).hostname or "", DEFAULT_TIMEOUT)
+
+def _clientNew() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2Enabled(),
+        headers={"User-Agent": "steamrec/0.1"},
+    )
+
+def _clientCurrent() -> httpx.AsyncClient:
+    """
+    pooled connections belong to the loop that opened them, so a caller on
+    a different loop (asyncio.run in a script) gets a fresh client"""
+
+    global _client, _clientLoop
+
+    loop = asyncio.get_running_loop()
+
+    if _client is None or _client.is_closed or _clientLoop is not loop:
+        _client = _clientNew()
+        _clientLoop = loop
+
+    return _client
+
+async def httpClientStart() -> httpx.AsyncClient:
+    return _clientCurrent()
+
+async def httpClientClose() -> None:
+    global _client, _clientLoop
+
+    # >> a client from a dead loop cant be closed cleanly; just drop it <<
+    if _client is not None and not _client.is_closed and _clientLoop is asyncio.get_running_loop():
+        await _client.aclose()
+
+    _client = None
+    _clientLoop = None
+
+def httpClientGet() -> httpx.AsyncClient:
+    """
+    the shared client (created on first use outside the app)"""
+
+    return _clientCurrent()
+
+async def httpGet(url: str, params: dict | None = None, **kwargs) -> httpx.Response:
+    kwargs.setdefault("timeout", timeoutFor(url))
+    return await httpClientGet().get(url, params=params, **kwargs)
+
+async def httpPost(url: str, data: dict | None = None, **kwargs) -> httpx.Response:
+    kwargs.setdefault("timeout", timeoutFor(url))
+    return await httpClientGet().post(url, data=data, **kwargs)
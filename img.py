@@ -31,4 +31,12 @@ def TryLoadUploadedImg(file: UploadFile) -> tuple[Image.Image | None, str | None
         img = Image.open(file.file).convert("RGB")
         return img, None
     except Exception as e:
-        return None, "Invalid or unsupported image file.."
\ No newline at end of file
+        return None, "Invalid or unsupported image file.."
+
+# >> same as above but for raw bytes; used for batch / archive uploads. <<
+def TryLoadImgBytes(data: bytes) -> tuple[Image.Image | None, str | None]:
+    try:
+        img = Image.open(BytesIO(data)).convert("RGB")
+        return img, None
+    except Exception as e:
+        return None, "Invalid or unsupported image file.."
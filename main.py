@@ -1,21 +1,36 @@
 import os
 import re
-import httpx
+import json
 import asyncio
-
-from db import all_fetch, dbInitiate, single_fetch 
-from dbsync import dbsync_owned
-from rec import BuildUserProfile_genre, GameScoring, GenCandidates, BuildUserProfile_cat, ScoreGameMulti, bestVisualResultGet, GetBestRec, prefIdentifiedNonowned
-from steamdata import f_appdetails_cached, cacheBackfill
-from img import LoadImageViaURL, imgInfo, TryLoadUploadedImg
-from clip import EmbedImgURL, EmbedUploaded, embedSSRows, findTopMatches, colMatchByAppid, UpsertSSEmbedding, findStoredTopMatches, embedMissingSS, rerankASMulti
-from clip import centroidReranker, txtPromptRerank
+import tarfile
+import zipfile
+import numpy as np
+
+from db import all_fetch, dbInitiate, single_fetch, timestamp
+from dbsync import dbsync_owned_shared, dbsync_owned_background, dbsync_owned_pending, OWNED_STALE_SEC
+from rec import UserProfilesGet, ScoreGameMulti, bestVisualResultGet, GetBestRec, prefIdentifiedNonowned, OwnedAppidsGet
+from steamdata import f_appdetails_cached, f_appdetails_bulk, cacheBackfill, storeLimiter, detailsCacheStats, appdetailsCompact
+from appmatrix import topRecsGet
+from batchrec import runBatchRecs, precomputedRecsGet
+from cooc import coocScoresGet, coocRebuild
+from visualtaste import visualRecsGet
+from simgraph import simGraphRebuild, simGraphUpdate, similarGet
+from appmeta import appMetaGet, appAssetCountsGet
+from img import LoadImageViaURL, imgInfo, TryLoadUploadedImg, TryLoadImgBytes
+from clip import EmbedImgURL, EmbedUploaded, embedSSRows, UpsertSSEmbedding, embedMissingSS
+from clip import EmbedPILImgBatch, searchTxtQueries
+from clip import findTopMatchesArr, findStoredTopMatchesArr, colMatchByAppidArr, rerankASMultiArr, centroidRerankerArr, txtPromptRerankArr, matchRowsGet
+from clip import CLIP_LOAD_MODE, modelWarmup, modelState, storedIndexGet, storedIndexState, rerankParityCheck
 from urllib.parse import urlencode
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, UploadFile, File, Query
+from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse, StreamingResponse
 from itsdangerous import URLSafeSerializer
 from contextlib import asynccontextmanager
+from admission import inferenceGate, InferenceBusy
+from httpclient import httpClientStart, httpClientClose, httpPost
+from refresher import refreshLoop, refreshTick, refreshState
+from catalog import catalogIngest, checkpointGet, CATALOG_PAGE_SIZE
 
 load_dotenv()
 
@@ -55,9 +70,8 @@ async def openid_verify(query_params: dict) -> str:
     data = dict(query_params)
     data["openid.mode"] = "check_authentication"
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.post(steam_openid_url, data=data)
-        return "is_valid:true" in response.text
+    response = await httpPost(steam_openid_url, data=data)
+    return "is_valid:true" in response.text
 
 # >>> steamid64 extraction process. <<< 
 def sid64_extract(steam_id: str) -> str | None:
@@ -80,13 +94,97 @@ def GSessionSID64(request: Request) -> str | None:
     except Exception:
         return None
 
+# >> model + screenshot index warmup; runs off the event loop so /login etc. 
+# can be served while clip is still loading. <<
+def clipWarmup() -> None:
+    try:
+        modelWarmup()
+        storedIndexGet()
+    except Exception as e:
+        print(f"Warning: clip warmup failed: {e}")
+
+def appdetailsCompactStartup() -> None:
+    try:
+        res = appdetailsCompact()
+        if res["undecodable"]:
+            print(f"Warning: {res['undecodable']} app_details rows could not be parsed; left as is")
+    except Exception as e:
+        print(f"Warning: app_details compaction failed: {e}")
+
 @asynccontextmanager  
 async def lifespan(app: FastAPI):
     dbInitiate()
+
+    await httpClientStart()
+
+    if CLIP_LOAD_MODE == "eager":
+        app.state.warmup = asyncio.create_task(asyncio.to_thread(clipWarmup))
+
+    # >> old full-json app_details rows -> slim compressed blobs; reads handle both meanwhile <<
+    app.state.compact = asyncio.create_task(asyncio.to_thread(appdetailsCompactStartup))
+
+    # >> keeps known apps fresh so requests dont wait on the store <<
+    app.state.refresher = None
+    if os.getenv("APPDETAILS_REFRESH", "1") not in ("0", "false", "off"):
+        app.state.refresher = asyncio.create_task(refreshLoop())
+
     yield
 
+    if app.state.refresher is not None:
+        app.state.refresher.cancel()
+        await asyncio.gather(app.state.refresher, return_exceptions=True)
+
+    # >> an ingest cut off here resumes from its checkpoint next time <<
+    catalog = getattr(app.state, "catalog", None)
+    if catalog is not None:
+        catalog.cancel()
+        await asyncio.gather(catalog, return_exceptions=True)
+
+    await httpClientClose()
+
 app = FastAPI(lifespan=lifespan)
 
+# >> load shedding for clip routes; see admission.py <<
+@app.exception_handler(InferenceBusy)
+async def inferenceBusyHandler(request: Request, exc: InferenceBusy):
+    return JSONResponse(
+        {"error": exc.reason},
+        status_code=503,
+        headers={"Retry-After": str(exc.retryAfter)},
+    )
+
+@app.get("/metrics/store")
+def storeMetrics():
+    return {"limiter": storeLimiter.stats(), "details_cache": detailsCacheStats(), "refresher": refreshState()}
+
+@app.get("/metrics/inference")
+def inferenceMetrics():
+    return inferenceGate.stats()
+
+# >> readiness probe. 503 until db, model and screenshot index are usable.
+# in lazy mode model / index load on first use so they dont block readiness. <<
+@app.get("/ready")
+def ready():
+    try:
+        dbOk = single_fetch("SELECT 1 AS ok")["ok"] == 1
+        dbErr = None
+    except Exception as e:
+        dbOk = False
+        dbErr = str(e)
+
+    lazy = CLIP_LOAD_MODE != "eager"
+    model = modelState()
+    index = storedIndexState()
+
+    checks = {
+        "db": {"ready": dbOk, "error": dbErr},
+        "model": {"ready": model["warm"] or lazy, **model},
+        "index": {"ready": index["loaded"] or lazy, **index},
+    }
+    isReady = all(c["ready"] for c in checks.values())
+
+    return JSONResponse({"ready": isReady, "checks": checks}, status_code=200 if isReady else 503)
+
 # >>> login route; if user logged in, shows steamid64 as well a owned games and logout links. 
 #  if not logged in, shows login link. <<<
 @app.get("/", response_class=HTMLResponse)
@@ -158,41 +256,66 @@ def me(request: Request):
 
 # >>> + owned games list via steam api. 
 # 401 = unauthorised; 500 = missing API key. <<<
+def ownedStateGet(steamid64: str):
+    return single_fetch(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM owned_games WHERE steamid64 = ?) AS total,
+            (SELECT owned_synced_at FROM users WHERE steamid64 = ?) AS last_synced
+        """,
+        (steamid64, steamid64)
+    )
+
 @app.get("/me/owned-games")
-async def owned_games(request: Request):
+async def owned_games(request: Request, limit: int = 30):
+    """
+    top owned games by playtime, served from owned_games.
+    a stale library is returned as-is and re-synced in the background;
+    only a never-synced user waits on steam"""
+
     steamid64 = GSessionSID64(request)
     if not steamid64:
         return JSONResponse({"error": "User is not logged in."}, status_code=401)
-    
-    if not steam_api_key:
-        return JSONResponse({"error": "User did not provide Steam API key."}, status_code=500)
-    url = "https://api.steampowered.com/IPlayerService/GetOwnedGames/v0001"
-    params = {
-        "key": steam_api_key,
-        "steamid": steamid64,
-        "format": "json",
-        "include_appinfo": 1,
-        "include_played_free_games": 1,
-        "format": "json",
-    }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+    state = ownedStateGet(steamid64)
+
+    if state["last_synced"] is None:
+        if not steam_api_key:
+            return JSONResponse({"error": "User did not provide Steam API key."}, status_code=500)
+        await dbsync_owned_shared(steamid64)
+        state = ownedStateGet(steamid64)
 
-# >>> returns trimmed view, of users top owned games. sorted by playtime. <<<
-    games = data.get("response", {}).get("games", []) or []
-    sorted_games = sorted(games, key = lambda g: g.get("playtime_forever", 0), reverse=True)
+    stale = state["last_synced"] is not None and timestamp() - state["last_synced"] > OWNED_STALE_SEC
+    if stale and steam_api_key:
+        dbsync_owned_background(steamid64)
+
+# >>> returns trimmed view, of users top owned games. sorted by playtime (idx_owned_games_playtime). <<<
+    rows = all_fetch(
+        """
+        SELECT appid, name, pt_forever_min
+        FROM owned_games
+        WHERE steamid64 = ?
+        ORDER BY pt_forever_min DESC
+        LIMIT ?
+        """,
+        (steamid64, max(1, min(limit, 500)))
+    )
     top_owned = [
         {
-            "appid": i.get("appid"),
-            "name": i.get("name"),
-            "pt_hours_min":i.get("playtime_forever", 0)
+            "appid": r["appid"],
+            "name": r["name"],
+            "pt_hours_min": r["pt_forever_min"]
         }
-        for i in sorted_games[:30] 
+        for r in rows
     ]
-    return {"steamid64": steamid64, "top_games": top_owned, "total_games": len(games)}
+    return {
+        "steamid64": steamid64,
+        "top_games": top_owned,
+        "total_games": state["total"],
+        "last_synced": state["last_synced"],
+        "stale": stale,
+        "resyncing": dbsync_owned_pending(steamid64),
+    }
 
 @app.get("/sync/owned-games")
 async def SyncOwned(request: Request):
@@ -206,7 +329,7 @@ async def SyncOwned(request: Request):
     if not steamid64:
         return JSONResponse({"error": "Not logged in."}, status_code=401)
     
-    res = await dbsync_owned(steamid64)
+    res = await dbsync_owned_shared(steamid64)
     return res
 
 @app.get("/index/from-owned")
@@ -220,15 +343,16 @@ async def IndexOwned(request: Request):
     appids = [int(row["appid"]) for row in rows]
 
     index = 0
+    failed = 0
 
-    for appid in appids[:300]:
-        details = await f_appdetails_cached(appid)
-
+    # >> cache hits are free; network calls share storeLimiter's budget <<
+    async for appid, details, err in f_appdetails_bulk(appids[:300]):
         if details:
             index += 1
-        await asyncio.sleep(0.25) # >> rate limit to 240 req/min <<<
+        if err:
+            failed += 1
 
-    return {"index": index, "checked": min(len(appids), 300)}
+    return {"index": index, "checked": min(len(appids), 300), "failed": failed}
 
 # >> temp to populate "app_index". !!! remove after testing finished. <<<
 @app.get("/index/from-list")
@@ -243,44 +367,129 @@ async def IndexFromList(request: Request, appids: str):
             parse.append(int(p))
 
     index = 0
-    for appid in parse[:500]:
-        details = await f_appdetails_cached(appid)
+    failed = 0
 
+    async for appid, details, err in f_appdetails_bulk(parse[:500]):
         if details:
             index += 1
-        await asyncio.sleep(0.25)
+        if err:
+            failed += 1
 
-    return {"index": index, "checked": min(len(parse), 500)}
+    return {"index": index, "checked": min(len(parse), 500), "failed": failed}
 
 @app.get("/rec")
-async def rec(request: Request):
+async def rec(request: Request, mode: str = "content"):
     """
     Build user profile; generate recommendations. WIP.
+    mode=visual -> rank by the users screenshot taste vector instead.
 
     """
     steamid64 = GSessionSID64(request)
     if not steamid64:
         return JSONResponse({"error": "Not logged in."}, status_code=401)
-    
-    UserProfile = await BuildUserProfile_genre(steamid64)
-    CatProfile = await BuildUserProfile_cat(steamid64)
 
-    candidates = GenCandidates(UserProfile, limit=500, explore=250)
+    if mode not in ("content", "visual"):
+        return JSONResponse({"error": "mode must be content or visual."}, status_code=400)
 
-    # >>> filter out owned games. <<<
+    if mode == "visual":
+        OwnedAppIDs = OwnedAppidsGet(steamid64)
+        VisualRecs = await asyncio.to_thread(visualRecsGet, steamid64, OwnedAppIDs, 20)
+        return {"steamid64": steamid64, "recommendations": VisualRecs, "computed_at": None, "source": "visual"}
 
-    OwnedGames = all_fetch("SELECT appid FROM owned_games WHERE steamid64 = ?", (steamid64, ))
-    OwnedAppIDs = {int(row["appid"]) for row in OwnedGames}
-    candidates = [aID for aID in candidates if aID not in OwnedAppIDs]
+    UserProfile, CatProfile = await UserProfilesGet(steamid64)
 
-    RecScoredData = []
+    if not UserProfile:
+        return {"steamid64": steamid64, "recommendations": []}
 
-    for appid in candidates:
-        score, reasons = await GameScoring(appid, UserProfile, CatProfile)
-        RecScoredData.append({"appid": appid, "Score": score, "Reasons": reasons})
+    OwnedAppIDs = OwnedAppidsGet(steamid64)
+    cf = coocScoresGet(steamid64, exclude=OwnedAppIDs)
+
+    # >>> serve the batch job's results when the user has them. <<<
+    pre = precomputedRecsGet(steamid64, UserProfile, CatProfile, exclude=OwnedAppIDs, k=20, cf=cf)
+    if pre is not None:
+        return {
+            "steamid64": steamid64,
+            "recommendations": pre["recommendations"],
+            "computed_at": pre["computed_at"],
+            "source": "precomputed",
+        }
 
-    RecScoredData.sort(key = lambda x: x["Score"], reverse = True)
-    return {"steamid64": steamid64, "recommendations": RecScoredData[:20]}
+    # >>> otherwise whole catalogue scored live in one pass; owned games filtered out. <<<
+    RecScoredData = topRecsGet(UserProfile, CatProfile, exclude=OwnedAppIDs, k=20, cf=cf)
+
+    return {"steamid64": steamid64, "recommendations": RecScoredData, "computed_at": None, "source": "live"}
+
+@app.get("/jobs/cooc/rebuild")
+async def jobCoocRebuild():
+    """
+    rebuild the co-ownership index from scratch; 
+    normally its kept up to date by /sync/owned-games"""
+
+    return await asyncio.to_thread(coocRebuild)
+
+@app.get("/jobs/similar/rebuild")
+async def jobSimilarRebuild(k: int = 20):
+    """
+    rebuild the visual similar-games graph from scratch;
+    embedding routes update it incrementally afterwards"""
+
+    return await asyncio.to_thread(simGraphRebuild, k)
+
+@app.get("/similar/{appid}")
+def similar(appid: int, limit: int = 20):
+    """
+    games whose screenshots look most like this one (precomputed)"""
+
+    res = similarGet(appid, limit=limit)
+    if res is None:
+        return JSONResponse({"error": "No visual neighbours for appid (no embeddings, or graph not built)."}, status_code=404)
+
+    return {"appid": appid, "similar": res}
+
+@app.get("/jobs/appdetails/refresh")
+async def jobAppdetailsRefresh():
+    """
+    run one refresh pass now (normally on a timer from the lifespan)"""
+
+    return await refreshTick()
+
+@app.get("/jobs/appdetails/compact")
+async def jobAppdetailsCompact(vacuum: bool = False):
+    """
+    slim + compress any plain json app_details rows left;
+    vacuum=true also shrinks the db file (locks the db while it runs)"""
+
+    return await asyncio.to_thread(appdetailsCompact, 500, vacuum)
+
+@app.get("/jobs/catalog/ingest")
+async def jobCatalogIngest(max_apps: int | None = None, page_size: int = CATALOG_PAGE_SIZE):
+    """
+    start (or resume) the steam catalogue ingest in the background; see catalog.py"""
+
+    task = getattr(app.state, "catalog", None)
+    if task is not None and not task.done():
+        return JSONResponse({"error": "catalog ingest already running", "checkpoint": checkpointGet()}, status_code=409)
+
+    app.state.catalog = asyncio.create_task(catalogIngest(max_apps, page_size))
+    return {"started": True, "checkpoint": checkpointGet()}
+
+@app.get("/jobs/catalog/status")
+async def jobCatalogStatus():
+    task = getattr(app.state, "catalog", None)
+    out = {"running": task is not None and not task.done(), "checkpoint": checkpointGet()}
+
+    if task is not None and task.done() and not task.cancelled() and task.exception() is not None:
+        out["error"] = str(task.exception()) or type(task.exception()).__name__
+
+    return out
+
+@app.get("/jobs/rec/batch")
+async def jobRecBatch(top_k: int = 50, chunk: int = 256):
+    """
+    recompute precomputed recommendations for every synced user.
+    also runnable offline: python batchrec.py"""
+
+    return await asyncio.to_thread(runBatchRecs, top_k, chunk)
 
 # >> sanity check to show stored screenshot count. <<
 @app.get("/ss/count")
@@ -325,6 +534,7 @@ def ssLoadTest():
     }
 
 @app.get("/clip/testdb")
+@inferenceGate.gated
 def clipTestDB():
     row = single_fetch(
         """
@@ -346,6 +556,7 @@ def clipTestDB():
     }
 
 @app.post("/clip/testupload")
+@inferenceGate.gated
 def clipTestUpload(f: UploadFile = File(...)):
     emb, err = EmbedUploaded(f)
 
@@ -372,6 +583,7 @@ def uploadTest(file: UploadFile = File(...)):
     }
 
 @app.post("/id/test")
+@inferenceGate.gated
 def idTest(file: UploadFile = File(...)):
     """
     User uploads an image -> image compared to stored steam screenshots.
@@ -386,13 +598,19 @@ def idTest(file: UploadFile = File(...)):
     if not embeddedRows:
         return JSONResponse({"error": "No embedded screenshots found."}, status_code=404)
     
-    matches = findTopMatches(query_emb, embeddedRows, top_k=15)
-    appMatches = colMatchByAppid(matches)
+    embeds = np.stack([r["embed"] for r in embeddedRows], axis = 0)
+    top, scores = findTopMatchesArr(query_emb, embeds, top_k=15)
+    matches = {
+        "appid": np.array([int(embeddedRows[i]["appid"]) for i in top], dtype=np.int64),
+        "url": np.array([embeddedRows[i]["url"] for i in top], dtype=object),
+        "score": scores,
+    }
+    appMatches = colMatchByAppidArr(matches)
 
     return {
         "filename": file.filename,
         "searched_rows": len(embeddedRows),
-        "matches": appMatches[:5],
+        "matches": matchRowsGet(appMatches, 5),
     }
 
 def visualScoreGet(item: dict) -> float:
@@ -481,38 +699,29 @@ def visConfidenceGet(candidates: list[dict]) -> dict:
         "gap": gap
     }
 
-@app.post("/id/fit")
-async def idFit(request: Request, file: UploadFile = File(...)):
-    """
-    Userr uploads image -> image compared to stored steam screenshots
-    -> ranks similarities to find matches then returns output...
+def idMatchesGet(queryEmb, ssMatches: dict) -> list[dict]:
     """
+    run the rerank stages for one query (ss matches as columns).
+    returns the top 5 app matches (empty if nothing is indexed)"""
 
-    steamid64 = GSessionSID64(request)
-    if not steamid64:
-        return JSONResponse({"error": "Not logged in."}, status_code=401)
-    
-    queryEmb, err = EmbedUploaded(file)
-    if err:
-        return JSONResponse({"error": err}, status_code=400)
+    appMatchesAS = rerankASMultiArr(ssMatches)
+    if not len(appMatchesAS["appid"]):
+        return []
 
-    ssMatches = findStoredTopMatches(queryEmb, top_k=250)
-    appMatchesAS = rerankASMulti(ssMatches)
-    appMatchesCR = centroidReranker(queryEmb, appMatchesAS, sl_k=30)
-    appMatchesTPR = txtPromptRerank(queryEmb, appMatchesCR, sl_k = 30, bMax = 0.04)
+    appMatchesCR = centroidRerankerArr(queryEmb, appMatchesAS, sl_k=30)
+    appMatchesTPR = txtPromptRerankArr(queryEmb, appMatchesCR, sl_k = 30, bMax = 0.04)
 
-    if not appMatchesAS:
-        return JSONResponse({"error": "No stored screenshot embeddings found."}, status_code=404)
-    
-    topMatches = appMatchesTPR[:5]
-    topAppids = [int(match["appid"]) for match in topMatches]
+    return matchRowsGet(appMatchesTPR, 5)
 
-    fResults = await ScoreGameMulti(topAppids, steamid64)
-    fByAppid = {int(app["appid"]): app for app in fResults}
+async def idFitResultGet(topMatches: list[dict], steamid64: str, genreProfile, catProfile, OwnedAppids: set[int]) -> dict:
+    """
+    combine visual matches with the users fit score.
+    profiles + owned set are passed in so they can be shared across images"""
 
-    Owned = all_fetch("SELECT appid FROM owned_games WHERE steamid64 = ?", (steamid64,))
-    OwnedAppids = {int(row["appid"]) for row in Owned}
+    topAppids = [int(match["appid"]) for match in topMatches]
 
+    fResults = await ScoreGameMulti(topAppids, steamid64, genreProfile, catProfile)
+    fByAppid = {int(app["appid"]): app for app in fResults}
 
     combinedR = []
 
@@ -539,7 +748,6 @@ async def idFit(request: Request, file: UploadFile = File(...)):
     VisualConfidence = visConfidenceGet(VisualCandidates)
 
     return {
-        "filename": file.filename,
         "best_visual": bestVis,
         "id_owned": idOwned,
         "visual_confidence": VisualConfidence,
@@ -548,6 +756,255 @@ async def idFit(request: Request, file: UploadFile = File(...)):
         "result": combinedR
     }
 
+@app.post("/id/fit")
+async def idFit(request: Request, file: UploadFile = File(...)):
+    """
+    Userr uploads image -> image compared to stored steam screenshots
+    -> ranks similarities to find matches then returns output...
+    """
+
+    steamid64 = GSessionSID64(request)
+    if not steamid64:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+    
+    async with inferenceGate.slot():
+        queryEmb, err = await asyncio.to_thread(EmbedUploaded, file)
+        if err:
+            return JSONResponse({"error": err}, status_code=400)
+
+        ssMatches = (await asyncio.to_thread(findStoredTopMatchesArr, queryEmb, 250))[0]
+        topMatches = await asyncio.to_thread(idMatchesGet, queryEmb, ssMatches)
+
+    if not topMatches:
+        return JSONResponse({"error": "No stored screenshot embeddings found."}, status_code=404)
+
+    genreProfile, catProfile = await UserProfilesGet(steamid64)
+    OwnedAppids = OwnedAppidsGet(steamid64)
+
+    res = await idFitResultGet(topMatches, steamid64, genreProfile, catProfile, OwnedAppids)
+    return {"filename": file.filename, **res}
+
+# >> upload size caps for /id/fit/batch: per image / archive entry, and for the whole call <<
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_UPLOAD_TOTAL_BYTES = int(os.getenv("MAX_UPLOAD_TOTAL_BYTES", str(512 * 1024 * 1024)))
+
+# >> yields (name, raw bytes, error) for every uploaded image.
+# archives are read entry by entry; tar is read as a stream.
+# declared sizes are checked first, then reads are capped anyway so a lying
+# header cant get more than MAX_UPLOAD_BYTES into memory. <<
+def uploadEntriesGet(files: list[UploadFile], archive: UploadFile | None, limit: int):
+    count = 0
+    total = 0
+    tooLarge = f"File too large (max {MAX_UPLOAD_BYTES} bytes)."
+    budgetErr = f"Upload too large (max {MAX_UPLOAD_TOTAL_BYTES} bytes in total)."
+
+    def take(name: str, declared: int | None, read) -> tuple[tuple, bool]:
+        """
+        ((name, data, error), stop). stop once the total budget is spent"""
+
+        nonlocal total
+
+        if declared is not None and declared > MAX_UPLOAD_BYTES:
+            return (name, None, tooLarge), False
+        if total + (declared or 0) > MAX_UPLOAD_TOTAL_BYTES:
+            return (name, None, budgetErr), True
+
+        data = read(MAX_UPLOAD_BYTES + 1)
+        if data is not None and len(data) > MAX_UPLOAD_BYTES:
+            return (name, None, tooLarge), False
+
+        total += len(data or b"")
+        if total > MAX_UPLOAD_TOTAL_BYTES:
+            return (name, None, budgetErr), True
+
+        return (name, data, None), False
+
+    for f in files:
+        if count >= limit:
+            return
+        count += 1
+        entry, stop = take(f.filename, f.size, f.file.read)
+        yield entry
+        if stop:
+            return
+
+    if archive is None:
+        return
+
+    fo = archive.file
+    fo.seek(0)
+    isZip = zipfile.is_zipfile(fo)
+    fo.seek(0)
+
+    if isZip:
+        with zipfile.ZipFile(fo) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                if count >= limit:
+                    return
+                count += 1
+
+                def read(n, info=info):
+                    with zf.open(info) as ex:
+                        return ex.read(n)
+
+                entry, stop = take(info.filename, info.file_size, read)
+                yield entry
+                if stop:
+                    return
+        return
+
+    try:
+        tf = tarfile.open(fileobj=fo, mode="r|*")
+    except tarfile.TarError:
+        yield archive.filename, None, None
+        return
+
+    with tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            if count >= limit:
+                return
+            count += 1
+            ex = tf.extractfile(member)
+
+            entry, stop = take(member.name, member.size, ex.read if ex else lambda n: None)
+            yield entry
+            if stop:
+                return
+
+async def idFitBatchStream(entries, steamid64: str, batch: int):
+    """
+    embed uploads in batches and stream one ndjson line per image.
+    user level work (profiles, owned set) is done once up front"""
+
+    genreProfile, catProfile = await UserProfilesGet(steamid64)
+    OwnedAppids = OwnedAppidsGet(steamid64)
+
+    processed = 0
+    failed = 0
+    chunk = []
+
+    def line(payload: dict) -> str:
+        return json.dumps(payload, default=str) + "\n"
+
+    async def flush(chunk):
+        nonlocal processed, failed
+
+        names, imgs = [], []
+
+        # >> decoding is cpu bound; keep it off the event loop <<
+        def decode(chunk):
+            return [
+                (name, *(TryLoadImgBytes(data) if data is not None else (None, err or "Invalid or unsupported image file..")))
+                for name, data, err in chunk
+            ]
+
+        for name, img, err in await asyncio.to_thread(decode, chunk):
+            processed += 1
+
+            if err:
+                failed += 1
+                yield line({"filename": name, "error": err})
+                continue
+
+            names.append(name)
+            imgs.append(img)
+
+        if not imgs:
+            return
+
+        # >> one inference slot per chunk; a full gate mid-stream fails the chunk, not the stream <<
+        try:
+            async with inferenceGate.slot():
+                embs = await asyncio.to_thread(EmbedPILImgBatch, imgs)
+                ssMatchesAll = await asyncio.to_thread(findStoredTopMatchesArr, embs, 250)
+                topMatchesAll = [
+                    await asyncio.to_thread(idMatchesGet, queryEmb, ssMatches)
+                    for queryEmb, ssMatches in zip(embs, ssMatchesAll)
+                ]
+        except InferenceBusy as e:
+            failed += len(names)
+            for name in names:
+                yield line({"filename": name, "error": e.reason, "retry_after": e.retryAfter})
+            return
+
+        for name, topMatches in zip(names, topMatchesAll):
+            if not topMatches:
+                failed += 1
+                yield line({"filename": name, "error": "No stored screenshot embeddings found."})
+                continue
+
+            res = await idFitResultGet(topMatches, steamid64, genreProfile, catProfile, OwnedAppids)
+            yield line({"filename": name, **res})
+
+    # >> archive reads + decompression happen in the generator; step it in a thread <<
+    while True:
+        entry = await asyncio.to_thread(next, entries, None)
+        if entry is None:
+            break
+
+        chunk.append(entry)
+
+        if len(chunk) >= batch:
+            async for out in flush(chunk):
+                yield out
+            chunk = []
+
+    if chunk:
+        async for out in flush(chunk):
+            yield out
+
+    yield line({"done": True, "processed": processed, "failed": failed})
+
+@app.post("/id/fit/batch")
+async def idFitBatch(
+    request: Request,
+    files: list[UploadFile] = File(default=[]),
+    archive: UploadFile | None = File(default=None),
+    batch: int = 16,
+    limit: int = 500,
+):
+    """
+    /id/fit for many images in one call.
+    accepts several files and/or a zip / tar archive;
+    streams results back as ndjson as each batch finishes"""
+
+    steamid64 = GSessionSID64(request)
+    if not steamid64:
+        return JSONResponse({"error": "Not logged in."}, status_code=401)
+
+    if not files and archive is None:
+        return JSONResponse({"error": "No files uploaded."}, status_code=400)
+
+    inferenceGate.capacityCheck()
+
+    entries = uploadEntriesGet(files, archive, limit=limit)
+    return StreamingResponse(
+        idFitBatchStream(entries, steamid64, batch=max(1, batch)),
+        media_type="application/x-ndjson",
+    )
+
+@app.get("/search/text")
+@inferenceGate.gated
+def searchText(q: list[str] = Query(...), top_k: int = 10):
+    """
+    free text -> screenshot search, i.e. /search/text?q=snowy+pixel-art+platformer
+    repeat q for several queries; they share one text encoder pass"""
+
+    queries = [i.strip() for i in q if i.strip()]
+    if not queries:
+        return JSONResponse({"error": "Empty query."}, status_code=400)
+
+    results = searchTxtQueries(queries, top_k = top_k)
+
+    if not results or not results[0]["searched_rows"]:
+        return JSONResponse({"error": "No stored screenshot embeddings found."}, status_code=404)
+
+    return {"results": results}
+
 @app.get("/embed/ss")
 def embedSS(limit: int = 200):
     """embed and store ss in sqlite"""
@@ -579,11 +1036,15 @@ def embedSS(limit: int = 200):
                     "error": str(e),
                 })
         
+    # >> keep the similar-games graph in step with the new embeddings <<
+    similar = simGraphUpdate() if done else None
+
     return{
         "processed": len(rows),
         "embedded": done,
         "failed": failed,
         "failed_samples": failedSamples,
+        "similar_graph": similar,
     }
 
 @app.get("/embed/count")
@@ -595,40 +1056,16 @@ def embedCount():
 @app.get("/embed/check")
 def embedCheck(appid: int):
     """check if embedding exists for given appid"""
-    ssRow = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM app_screenshots
-        WHERE appid = ?
-        """,
-        (appid,),
-    )
-
-    embRow = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM screenshot_embeddings
-        WHERE appid = ?
-        """,
-        (appid,),
-    )
-
-    infoRow = single_fetch(
-        """
-        SELECT appid, name
-        FROM app_index
-        WHERE appid = ?
-        """,
-        (appid,),
-    )
+    counts = appAssetCountsGet([appid])[appid]
+    info = appMetaGet([appid]).get(appid)
 
     return {
         "appid": appid,
-        "name": infoRow["name"] if infoRow else None,
-        "screenshot_count": ssRow["count"] if ssRow else 0,
-        "embedding_count": embRow["count"] if embRow else 0,
-        "has_screenshot": ssRow["count"] > 0 if ssRow else False,
-        "has_embedding": embRow["count"] > 0 if embRow else False,
+        "name": info["name"] if info else None,
+        "screenshot_count": counts["screenshot_count"],
+        "embedding_count": counts["embedding_count"],
+        "has_screenshot": counts["screenshot_count"] > 0,
+        "has_embedding": counts["embedding_count"] > 0,
     }
 
 @app.get("/embed/search")
@@ -645,33 +1082,16 @@ def embSearch(q: str):
     )
 
     results = []
+    counts = appAssetCountsGet([int(r["appid"]) for r in rows])
 
     for r in rows:
         appid = int(r["appid"])
 
-        ssRow = single_fetch(
-            """
-            SELECT COUNT(*) AS count
-            FROM app_screenshots
-            WHERE appid = ?
-            """,
-            (appid,),
-        )
-
-        embRow = single_fetch(
-            """
-            SELECT COUNT(*) AS count
-            FROM screenshot_embeddings
-            WHERE appid = ?
-            """,
-            (appid,),
-        )
-
         results.append({
             "appid": appid,
             "name": r["name"],
-            "screenshot_rows": ssRow["count"],
-            "embed_rows": embRow["count"]
+            "screenshot_rows": counts[appid]["screenshot_count"],
+            "embed_rows": counts[appid]["embedding_count"]
         })
 
     return {"query": q, "results": results}
@@ -741,7 +1161,9 @@ def covBackfill(limit: int = 200):
 # >> this one embeds only the screenshot rows which dont have a stored vector <<
 @app.get("/embed/ss/missing")
 def embedMissing(limit: int = 200, appid: int | None = None):
-    return embedMissingSS(limit=limit, appid=appid)
+    res = embedMissingSS(limit=limit, appid=appid)
+    res["similar_graph"] = simGraphUpdate() if res["embedded"] else None
+    return res
 
 @app.get("/coverage/confirm/appid")
 async def covConfirmAppid(appid: int):
@@ -753,23 +1175,7 @@ async def covConfirmAppid(appid: int):
     should fix the missing title (probably)"""
 
     # >> a before and after type thing; just in case i forget the variable names or smt <<
-    bSS = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM app_screenshots
-        WHERE appid = ?
-        """,
-        (appid,),
-    )["count"]
-
-    bEmb = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM screenshot_embeddings
-        WHERE appid = ?
-        """,
-        (appid,),
-    )["count"]
+    before = appAssetCountsGet([appid])[appid]
 
     det = await f_appdetails_cached(appid)
     if not det:
@@ -777,52 +1183,53 @@ async def covConfirmAppid(appid: int):
     
     covBackfillRes = cacheBackfill(appid)
     embedRes = embedMissingSS(limit=1000, appid=appid)
+    if embedRes["embedded"]:
+        embedRes["similar_graph"] = simGraphUpdate()
 
-    info = single_fetch(
-        """
-        SELECT name 
-        FROM app_index 
-        WHERE appid = ?
-        """,
-        (appid,),
-    )
-
-    aSS = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM app_screenshots
-        WHERE appid = ?
-        """,
-        (appid,),
-    )["count"]
+    info = appMetaGet([appid]).get(appid)
 
-    aEmb = single_fetch(
-        """
-        SELECT COUNT(*) AS count
-        FROM screenshot_embeddings
-        WHERE appid = ?
-        """,
-        (appid,),
-    )["count"]
+    after = appAssetCountsGet([appid])[appid]
 
     return {
         "appid": appid,
         "name": info["name"] if info else None,
 
         "before": {
-            "ss_rows": bSS,
-            "embed_rows": bEmb
+            "ss_rows": before["screenshot_count"],
+            "embed_rows": before["embedding_count"]
         },
 
         "backfill": covBackfillRes,
         "missing_embeds": embedRes,
 
         "after": {
-            "ss_rows": aSS,
-            "embed_rows": aEmb
+            "ss_rows": after["screenshot_count"],
+            "embed_rows": after["embedding_count"]
         },
     }
 
+@app.get("/dbg/rerank-parity")
+async def rerankParity(samples: int = 5, ss_k: int = 250, sl_k: int = 30):
+    """
+    list vs array rerank pipelines, using stored screenshots as queries.
+    scores should agree to within clip.PARITY_ATOL"""
+
+    index = storedIndexGet()
+    if not len(index["urls"]):
+        return JSONResponse({"error": "No embedded screenshots found."}, status_code=404)
+
+    picks = np.random.default_rng().choice(len(index["urls"]), size = min(samples, len(index["urls"])), replace = False)
+    checks = [
+        await asyncio.to_thread(rerankParityCheck, index["embeds"][i], ss_k, sl_k)
+        for i in picks
+    ]
+
+    return {
+        "ok": all(c["ok"] for c in checks),
+        "max_abs_diff": max(c["max_abs_diff"] for c in checks),
+        "checks": checks,
+    }
+
 @app.get("/dbg/refresh-appdetails")
 async def refAppDetails(appids: str):
     parsed = []
@@ -834,12 +1241,11 @@ async def refAppDetails(appids: str):
 
     refresh = []
 
-    for appid in parsed:
-        data = await f_appdetails_cached(appid, forceRef = True)
-
+    async for appid, data, err in f_appdetails_bulk(parsed, forceRef = True):
         refresh.append({
             "appid": appid,
             "refreshed": data is not None,
+            "error": err,
             "name": data.get("name") if data else None,
             "genres": [
                 g.get("description")
@@ -848,7 +1254,9 @@ async def refAppDetails(appids: str):
             ] if data else [],
         })
 
-        await asyncio.sleep(0.25)
+    # >> completion order -> request order <<
+    order = {a: i for i, a in enumerate(parsed)}
+    refresh.sort(key = lambda r: order[r["appid"]])
 
     return {
         "checked": len(parsed),
@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+from email.utils import parsedate_to_datetime
+
+# >>> rate limiting for outbound steam calls.
+# token bucket refilled at `rate` per second (up to `burst` saved up), with
+# AIMD on top: every success nudges the rate back up by `increase`, every
+# 429 / 5xx halves it and pauses everyone for the Retry-After window.
+# only charged right before a real network call, so cache hits are free. <<<
+
+def retryAfterParse(value: str | None, default: float) -> float:
+    """
+    Retry-After is either seconds or an http date"""
+
+    if not value:
+        return default
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float, burst: int, minRate: float, increase: float, backoff: float = 0.5, defaultPause: float = 2.0):
+        self.maxRate = rate
+        self.rate = rate
+        self.minRate = min(minRate, rate)
+        self.burst = max(1, burst)
+        self.increase = increase
+        self.backoff = backoff
+        self.defaultPause = defaultPause
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._pausedUntil = 0.0
+        self._lock: asyncio.Lock | None = None
+        self._lockLoop: asyncio.AbstractEventLoop | None = None
+
+        self.acquired = 0
+        self.throttled = 0
+        self.waitedSec = 0.0
+
+    def _lockGet(self) -> asyncio.Lock:
+        # >> asyncio locks are tied to a loop; scripts may run several <<
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lockLoop is not loop:
+            self._lock = asyncio.Lock()
+            self._lockLoop = loop
+        return self._lock
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """
+        wait for one token (and for any Retry-After pause to pass).
+        callers queue on the lock so tokens go out in order"""
+
+        started = time.monotonic()
+
+        async with self._lockGet():
+            while True:
+                now = time.monotonic()
+
+                if now < self._pausedUntil:
+                    await asyncio.sleep(self._pausedUntil - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    break
+
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+        self.acquired += 1
+        self.waitedSec += time.monotonic() - started
+
+    def success(self) -> None:
+        self.rate = min(self.maxRate, self.rate + self.increase)
+
+    def throttle(self, retryAfter: float | None = None) -> float:
+        """
+        multiplicative decrease + shared pause; returns the pause length"""
+
+        self.throttled += 1
+        self.rate = max(self.minRate, self.rate * self.backoff)
+
+        pause = self.defaultPause if retryAfter is None else retryAfter
+        self._pausedUntil = max(self._pausedUntil, time.monotonic() + pause)
+        self._tokens = 0.0
+        return pause
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.maxRate,
+            "min_rate": self.minRate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "paused_for": round(max(0.0, self._pausedUntil - time.monotonic()), 3),
+            "avg_wait_sec": round(self.waitedSec / self.acquired, 4) if self.acquired else 0.0,
+        }
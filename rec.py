@@ -1,11 +1,14 @@
+import os
 import math
 import json
 import random
+import asyncio
 
-from db import all_fetch, single_fetch
+from db import all_fetch, single_fetch, exec, timestamp
+from appmeta import appMetaGet
 
-from collections import Counter
-from steamdata import f_appdetails_cached
+from collections import Counter, OrderedDict
+from steamdata import f_appdetails_cached, knownBadAppidsGet
 
 # >>> extracts game genres. <<<
 def ext_genre(appdetails: dict) -> list[str]:
@@ -83,6 +86,142 @@ async def BuildUserProfile_cat(steamid64: str, TopGames_n: int = 50) -> Counter:
 
     return profile
     
+async def BuildUserProfiles(steamid64: str, TopGames_n: int = 50, concurrency: int = 8) -> tuple[Counter, Counter]:
+    """
+    genre + category profiles in one pass.
+    owned_games read once; app details resolved concurrently (bounded by concurrency).
+    same weights / filters as BuildUserProfile_genre and BuildUserProfile_cat"""
+
+    rows = all_fetch(
+        """
+        SELECT appid, pt_forever_min
+        FROM owned_games
+        WHERE steamid64 = ?
+        ORDER BY pt_forever_min DESC
+        LIMIT ?
+        """,
+        (steamid64, TopGames_n)
+    )
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    bad = knownBadAppidsGet([int(r["appid"]) for r in rows])
+
+    async def detailsGet(appid: int) -> dict | None:
+        if appid in bad:
+            return None
+        async with sem:
+            return await f_appdetails_cached(appid)
+
+    allDetails = await asyncio.gather(*(detailsGet(int(r["appid"])) for r in rows))
+
+    genreProfile = Counter()
+    catProfile = Counter()
+
+    for r, details in zip(rows, allDetails):
+        if not details:
+            continue
+
+        mins = int(r["pt_forever_min"])
+        weight = math.log1p(mins)
+
+        if mins >= 30: # >>> genre profile ignores games with less than 30 minutes playtime <<<
+            for genre in ext_genre(details):
+                genreProfile[genre] += weight
+
+        for c in details.get("categories", []):
+            if c.get("description"):
+                catProfile[c.get("description")] += weight
+
+    return genreProfile, catProfile
+
+# >> in-process copy of user_profiles; keyed by steamid64, lru bounded by PROFILE_CACHE_SIZE <<
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "2048"))
+
+_profileCache: OrderedDict[str, dict] = OrderedDict()
+
+def _profileCachePut(steamid64: str, entry: dict) -> None:
+    _profileCache[steamid64] = entry
+    _profileCache.move_to_end(steamid64)
+
+    while len(_profileCache) > PROFILE_CACHE_SIZE:
+        _profileCache.popitem(last = False)
+
+def _profileStampGet(steamid64: str, TopGames_n: int = 50) -> tuple:
+    """
+    (last owned_games change, newest app_index update among the users top games).
+    a profile is only rebuilt when one of these moves"""
+
+    row = single_fetch(
+        """
+        SELECT
+            COALESCE(
+                (SELECT owned_changed_at FROM users WHERE steamid64 = ?),
+                (SELECT MAX(last_synced) FROM owned_games WHERE steamid64 = ?)
+            ) AS last_synced,
+            (
+                SELECT MAX(ai.updated_at)
+                FROM (
+                    SELECT appid
+                    FROM owned_games
+                    WHERE steamid64 = ?
+                    ORDER BY pt_forever_min DESC
+                    LIMIT ?
+                ) t
+                JOIN app_index ai ON ai.appid = t.appid
+            ) AS meta_updated_at
+        """,
+        (steamid64, steamid64, steamid64, TopGames_n)
+    )
+
+    return (row["last_synced"], row["meta_updated_at"])
+
+async def UserProfilesGet(steamid64: str, TopGames_n: int = 50) -> tuple[Counter, Counter]:
+    """
+    cached BuildUserProfiles.
+    memory -> user_profiles table -> rebuild; rebuilt when the stamp changes"""
+
+    stamp = _profileStampGet(steamid64, TopGames_n)
+
+    hit = _profileCache.get(steamid64)
+    if hit and hit["stamp"] == stamp:
+        _profileCache.move_to_end(steamid64)
+        return hit["genres"], hit["categories"]
+
+    row = single_fetch(
+        """
+        SELECT genres, categories, last_synced, meta_updated_at
+        FROM user_profiles
+        WHERE steamid64 = ?
+        """,
+        (steamid64,)
+    )
+
+    if row and (row["last_synced"], row["meta_updated_at"]) == stamp:
+        genreProfile = Counter(json.loads(row["genres"]))
+        catProfile = Counter(json.loads(row["categories"]))
+    else:
+        genreProfile, catProfile = await BuildUserProfiles(steamid64, TopGames_n)
+
+        # >> building can refresh app metadata, so stamp again after <<
+        stamp = _profileStampGet(steamid64, TopGames_n)
+
+        exec(
+            """
+            INSERT INTO user_profiles (steamid64, genres, categories, last_synced, meta_updated_at, built_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(steamid64) DO UPDATE SET
+                genres = excluded.genres,
+                categories = excluded.categories,
+                last_synced = excluded.last_synced,
+                meta_updated_at = excluded.meta_updated_at,
+                built_at = excluded.built_at
+            """,
+            (steamid64, json.dumps(genreProfile), json.dumps(catProfile), stamp[0], stamp[1], timestamp())
+        )
+
+    _profileCachePut(steamid64, {"stamp": stamp, "genres": genreProfile, "categories": catProfile})
+    return genreProfile, catProfile
+
 def topMatch(itemlist: list[str], profile: Counter, n: int = 3) -> list[str]:
     rank = sorted(itemlist, key = lambda x: profile.get(x, 0), reverse = True)
     return [x for x in rank[:n] if profile.get(x, 0) > 0]
@@ -106,7 +245,12 @@ async def GameScoring(appid: int, genreProfile: Counter, catProfile: Counter) ->
 
     score = float(genreScore + 0.35 * catScore) # >> !!!! reminder to finetune starter weight.. <<<
 
-    # >> Outcome reasons; top three contributors.
+    return score, scoreReasonsGet(genres, cat, genreProfile, catProfile)
+
+def scoreReasonsGet(genres: list[str], cat: list[str], genreProfile: Counter, catProfile: Counter) -> list[str]:
+    """
+    Outcome reasons; top contributing genres + categories."""
+
     outcomeReasons = []
     topGenre = topMatch (genres, genreProfile, 2)
     topCat = topMatch (cat, catProfile, 2)
@@ -116,64 +260,84 @@ async def GameScoring(appid: int, genreProfile: Counter, catProfile: Counter) ->
     if topCat:
         outcomeReasons.append(f"Category match: {', '.join(topCat)}")
 
-    return score, outcomeReasons
+    return outcomeReasons
 
 # >>> generates candidate appids; should be based on profiles top genres? <<<
 def TopProfileGenres_get(profile, i = 3):
     return [gen for gen, _ in profile.most_common(i)]
 
-def GenCandidates(profile, limit = 300, explore = 150): # >>> explore -> random sample; should add some diversity <<<
+def GenCandidates(profile, limit = 300, explore = 150, steamid64: str | None = None): # >>> explore -> random sample; should add some diversity <<<
+    """
+    candidate appids: apps sharing a top genre + a random sample of the rest.
+    runs on app_genres in sql; owned games dropped when steamid64 given."""
+
     TopGenres = TopProfileGenres_get(profile)
 
     if not TopGenres:
         return []
 
-    rows = all_fetch("SELECT appid, genres FROM app_index")
-    MatchedGenres, OtherGenres = [], []
+    ph = ",".join("?" for _ in TopGenres)
+    matchedSql = f"""
+        SELECT ag.appid
+        FROM app_genres ag
+        JOIN genre_vocab gv ON gv.genre_id = ag.genre_id
+        WHERE gv.name IN ({ph})
+    """
 
-    for r in rows:
-        appid = int(r["appid"])
-        genres = json.loads(r["genres"] or "[]")
+    ownedSql = ""
+    ownedParams = []
 
-        if TopGenres and any(gen in genres for gen in TopGenres):
-            MatchedGenres.append((appid))
-        else:
-            OtherGenres.append((appid))
+    if steamid64:
+        ownedSql = "AND ai.appid NOT IN (SELECT appid FROM owned_games WHERE steamid64 = ?)"
+        ownedParams = [steamid64]
 
-    if len(OtherGenres) > explore :
-        OtherGenres = random.sample(OtherGenres, explore)
+    # >> apps the store says are gone (see app_details_failures) <<
+    ownedSql += "\n        AND ai.appid NOT IN (SELECT appid FROM app_details_failures WHERE transient = 0)"
+
+    MatchedGenres = [int(r["appid"]) for r in all_fetch(
+        f"""
+        SELECT ai.appid
+        FROM app_index ai
+        WHERE ai.appid IN ({matchedSql})
+        {ownedSql}
+        ORDER BY RANDOM()
+        LIMIT ?
+        """,
+        (*TopGenres, *ownedParams, limit)
+    )]
+
+    OtherGenres = [int(r["appid"]) for r in all_fetch(
+        f"""
+        SELECT ai.appid
+        FROM app_index ai
+        WHERE ai.appid NOT IN ({matchedSql})
+        {ownedSql}
+        ORDER BY RANDOM()
+        LIMIT ?
+        """,
+        (*TopGenres, *ownedParams, explore)
+    )]
 
     candidates = MatchedGenres + OtherGenres
     random.shuffle(candidates)
     
     return candidates[:limit]
 
+def OwnedAppidsGet(steamid64: str) -> set[int]:
+    """
+    set of appids the user owns (from last sync)."""
+
+    rows = all_fetch("SELECT appid FROM owned_games WHERE steamid64 = ?", (steamid64,))
+    return {int(row["appid"]) for row in rows}
+
 def indexinfoGet(appid: int) -> dict:
     """
     Get basic info from app_index for a given appid.
     """
-    row = single_fetch(
-        """
-        SELECT appid, name, genres, categories
-        FROM app_index
-        WHERE appid = ?
-        """,
-        (appid,)
-    )
-
-    if not row:
-        return None
-    
-    return {
-        "appid": int(row["appid"]),
-        "name": row["name"],
-        "genres": json.loads(row["genres"] or "[]"),
-        "categories": json.loads(row["categories"] or "[]")
-    }
+    return appMetaGet([appid]).get(appid)
 
 async def ScoreGame(appid: int, steamid64: str) -> dict:
-    genreProfile = await BuildUserProfile_genre(steamid64)
-    catProfile = await BuildUserProfile_cat(steamid64)
+    genreProfile, catProfile = await UserProfilesGet(steamid64)
 
     score, reasons = await GameScoring(appid, genreProfile, catProfile)
     appinfo = indexinfoGet(appid)
@@ -187,15 +351,23 @@ async def ScoreGame(appid: int, steamid64: str) -> dict:
         "categories": appinfo["categories"]
     }
 
-async def ScoreGameMulti(appids: list[int], steamid64: str) -> list[dict]:
-    genreProfile = await BuildUserProfile_genre(steamid64)
-    catProfile = await BuildUserProfile_cat(steamid64)
+async def ScoreGameMulti(appids: list[int], steamid64: str, genreProfile: Counter | None = None, catProfile: Counter | None = None) -> list[dict]:
+    """
+    score several appids for one user.
+    profiles can be passed in so batch callers only build them once."""
+
+    if genreProfile is None or catProfile is None:
+        genreProfile, catProfile = await UserProfilesGet(steamid64)
+
+    bad = knownBadAppidsGet(appids)
+    scored = [(0.0, []) if appid in bad else await GameScoring(appid, genreProfile, catProfile) for appid in appids]
 
+    # >> after scoring: fetching details may have just indexed the app <<
+    meta = appMetaGet(appids)
     results = []
 
-    for appid in appids:
-        score, reasons = await GameScoring(appid, genreProfile, catProfile)
-        appinfo = indexinfoGet(appid)
+    for appid, (score, reasons) in zip(appids, scored):
+        appinfo = meta.get(appid)
 
         results.append({
             "appid": appid,
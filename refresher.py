@@ -0,0 +1,98 @@
+import os
+import time
+import asyncio
+
+from db import all_fetch, timestamp
+from steamdata import f_appdetails_cached, readCountsFlush, storeLimiter, APPDETAILS_TTL, APPDETAILS_FAIL_TTL, APPDETAILS_TRANSIENT_TTL, fetchInflight
+
+# >>> background appdetails refresh.
+# every REFRESH_INTERVAL seconds: flush read counts, then refetch rows that
+# are within REFRESH_HORIZON of ttl (or past it), most read first. each tick
+# only spends REFRESH_BUDGET_SHARE of storeLimiter's rate so user triggered
+# fetches keep the rest. <<<
+
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "60"))
+REFRESH_HORIZON = float(os.getenv("REFRESH_HORIZON", "0.1"))
+REFRESH_BUDGET_SHARE = float(os.getenv("REFRESH_BUDGET_SHARE", "0.5"))
+
+_refreshState = {"ticks": 0, "refreshed": 0, "failed": 0, "last_tick": None, "last": None}
+
+def refreshCandidatesGet(limit: int, ttl_seconds: int = APPDETAILS_TTL, horizon: float = REFRESH_HORIZON) -> list[int]:
+    now = timestamp()
+    cutoff = now - int(ttl_seconds * (1 - horizon))
+
+    # >> apps with an unexpired failure are skipped, else a delisted app with
+    # a high read count would be first in line every tick <<
+    rows = all_fetch(
+        """
+        SELECT d.appid
+        FROM app_details d
+        WHERE d.fetched_at < ?
+          AND NOT EXISTS (
+            SELECT 1 FROM app_details_failures f
+            WHERE f.appid = d.appid
+              AND f.failed_at > CASE WHEN f.transient THEN ? ELSE ? END
+          )
+        ORDER BY d.reads DESC, d.fetched_at ASC
+        LIMIT ?
+        """,
+        (cutoff, now - APPDETAILS_TRANSIENT_TTL, now - APPDETAILS_FAIL_TTL, limit)
+    )
+    return [int(r["appid"]) for r in rows]
+
+async def refreshTick(interval: float = REFRESH_INTERVAL) -> dict:
+    """
+    one scheduler pass; also callable by hand via /jobs/appdetails/refresh"""
+
+    started = time.perf_counter()
+    flushed = await asyncio.to_thread(readCountsFlush)
+
+    budget = max(1, int(storeLimiter.rate * interval * REFRESH_BUDGET_SHARE))
+    appids = await asyncio.to_thread(refreshCandidatesGet, budget)
+
+    refreshed = 0
+    failed = 0
+
+    for appid in appids:
+        # >> already being fetched (swr / a user miss) <<
+        if fetchInflight(appid):
+            continue
+
+        try:
+            if await f_appdetails_cached(appid, forceRef=True):
+                refreshed += 1
+            else:
+                failed += 1
+        except Exception:
+            failed += 1
+
+    res = {
+        "flushed": flushed,
+        "budget": budget,
+        "due": len(appids),
+        "refreshed": refreshed,
+        "failed": failed,
+        "took_sec": round(time.perf_counter() - started, 3),
+    }
+
+    _refreshState["ticks"] += 1
+    _refreshState["refreshed"] += refreshed
+    _refreshState["failed"] += failed
+    _refreshState["last_tick"] = timestamp()
+    _refreshState["last"] = res
+
+    return res
+
+async def refreshLoop(interval: float = REFRESH_INTERVAL) -> None:
+    while True:
+        try:
+            await refreshTick(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Warning: appdetails refresh tick failed: {e}")
+
+        await asyncio.sleep(interval)
+
+def refreshState() -> dict:
+    return dict(_refreshState)
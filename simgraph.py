@@ -0,0 +1,197 @@
+import numpy as np
+
+from db import all_fetch, single_fetch, get_connection, timestamp
+from clip import appCentroidMatrixGet, f32toBytes, bytesToF32
+
+# >>> "what looks like this game?" graph.
+# top k neighbours per app by cosine between screenshot centroids, stored in
+# [app_visual_neighbors] so /similar/{appid} is a single indexed read.
+# [app_visual_centroids] holds the centroid each app was last indexed with;
+# simGraphUpdate only redoes the lists an app's move can actually affect. <<<
+
+SIM_K = 20
+SIM_DRIFT = 0.02    # >> 1 - cos(old, new) above this counts as a material change <<
+SIM_CHUNK = 1024
+
+def _inChunks(values: list, size: int = 500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _neighborRowsGet(C: dict, rows: np.ndarray, k: int = SIM_K) -> list[tuple]:
+    """
+    (appid, rank, neighbor, score) for the given rows of the centroid matrix.
+    scored in blocks of SIM_CHUNK apps against the whole matrix"""
+
+    n = len(C["appids"])
+    kk = min(k, n - 1)
+    out = []
+
+    if kk <= 0:
+        return out
+
+    for start in range(0, len(rows), SIM_CHUNK):
+        r = rows[start:start + SIM_CHUNK]
+        S = C["centroids"][r] @ C["centroids"].T
+        S[np.arange(len(r)), r] = -np.inf
+
+        top = np.argpartition(-S, kk - 1, axis = 1)[:, :kk]
+
+        for i, a in enumerate(r):
+            t = top[i]
+            t = t[np.lexsort((t, -S[i, t]))]
+            appid = int(C["appids"][a])
+            out.extend((appid, rank, int(C["appids"][j]), float(S[i, j])) for rank, j in enumerate(t, start = 1))
+
+    return out
+
+def _storedCentroidsGet() -> tuple[np.ndarray, list[np.ndarray]]:
+    rows = all_fetch("SELECT appid, embedding, dim FROM app_visual_centroids ORDER BY appid")
+    return (
+        np.array([int(r["appid"]) for r in rows], dtype=np.int64),
+        [bytesToF32(r["embedding"], int(r["dim"])) for r in rows],
+    )
+
+def _storedKGet() -> int:
+    """
+    k of the last simGraphRebuild (SIM_K if the graph predates it being stored)"""
+
+    row = single_fetch("SELECT MAX(k) AS k FROM app_visual_centroids")
+    return int(row["k"]) if row and row["k"] is not None else SIM_K
+
+def _centroidSnapshotWrite(connection, C: dict, rows: np.ndarray, builtAt: int, k: int) -> None:
+    connection.executemany(
+        """
+        INSERT INTO app_visual_centroids (appid, embedding, dim, built_at, k)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(appid) DO UPDATE SET
+            embedding = excluded.embedding,
+            dim = excluded.dim,
+            built_at = excluded.built_at,
+            k = excluded.k
+        """,
+        [(int(C["appids"][i]), f32toBytes(C["centroids"][i]), int(C["centroids"].shape[1]), builtAt, k) for i in rows],
+    )
+
+def simGraphRebuild(k: int = SIM_K) -> dict:
+    """
+    rebuild the whole graph from the current screenshot index"""
+
+    C = appCentroidMatrixGet()
+    n = len(C["appids"])
+    rows = np.arange(n)
+
+    edges = _neighborRowsGet(C, rows, k)
+
+    connection = get_connection()
+    connection.execute("DELETE FROM app_visual_neighbors")
+    connection.execute("DELETE FROM app_visual_centroids")
+    connection.executemany("INSERT INTO app_visual_neighbors (appid, rank, neighbor, score) VALUES (?, ?, ?, ?)", edges)
+    _centroidSnapshotWrite(connection, C, rows, timestamp(), k)
+    connection.commit()
+    connection.close()
+
+    return {"apps": n, "edges": len(edges), "k": k}
+
+def simGraphUpdate(k: int | None = None, drift: float = SIM_DRIFT) -> dict:
+    """
+    incremental update after new screenshot embeddings.
+    apps whose centroid moved more than drift (or are new / gone) are
+    "changed"; lists are redone for
+      - the changed apps themselves
+      - apps currently listing a changed app
+      - apps a changed app now beats the k-th neighbour of
+    k defaults to the one the graph was last rebuilt with, so lists keep one length.
+    needs a prior simGraphRebuild."""
+
+    oldIds, oldVecs = _storedCentroidsGet()
+    if not len(oldIds):
+        return {"built": False, "changed": 0, "refreshed": 0}
+
+    k = _storedKGet() if k is None else k
+
+    C = appCentroidMatrixGet()
+    appids = C["appids"]
+    n = len(appids)
+
+    # >> which apps moved <<
+    pos = np.minimum(np.searchsorted(oldIds, appids), len(oldIds) - 1)
+    found = oldIds[pos] == appids
+    changed = ~found
+
+    for i in np.flatnonzero(found):
+        old = oldVecs[pos[i]]
+        if len(old) != C["centroids"].shape[1] or 1.0 - float(old @ C["centroids"][i]) > drift:
+            changed[i] = True
+
+    removed = [int(a) for a in oldIds[~np.isin(oldIds, appids)]]
+    changedRows = np.flatnonzero(changed)
+
+    if not len(changedRows) and not removed:
+        return {"built": True, "changed": 0, "removed": 0, "refreshed": 0, "k": k}
+
+    moved = [int(a) for a in appids[changedRows]] + removed
+
+    # >> apps whose list contains a moved app <<
+    listing = set()
+    for part in _inChunks(moved):
+        ph = ",".join("?" for _ in part)
+        listing.update(int(r["appid"]) for r in all_fetch(f"SELECT DISTINCT appid FROM app_visual_neighbors WHERE neighbor IN ({ph})", tuple(part)))
+
+    # >> apps a changed app would now enter the list of <<
+    kth = np.full(n, -np.inf)
+    counts = np.zeros(n, dtype=np.int64)
+    for r in all_fetch("SELECT appid, MIN(score) AS kth, COUNT(*) AS count FROM app_visual_neighbors GROUP BY appid"):
+        i = int(np.searchsorted(appids, int(r["appid"])))
+        if i < n and appids[i] == int(r["appid"]):
+            kth[i] = float(r["kth"])
+            counts[i] = int(r["count"])
+
+    entering = np.zeros(n, dtype=bool)
+    if len(changedRows):
+        for start in range(0, n, SIM_CHUNK):
+            block = np.arange(start, min(start + SIM_CHUNK, n))
+            S = C["centroids"][block] @ C["centroids"][changedRows].T
+            S[block[:, None] == changedRows[None, :]] = -np.inf
+            entering[block] = (S.max(axis = 1) > kth[block]) | (counts[block] < min(k, n - 1))
+
+    listingRows = np.flatnonzero(np.isin(appids, np.fromiter(listing, dtype=np.int64)))
+    refresh = np.union1d(np.union1d(changedRows, listingRows), np.flatnonzero(entering))
+
+    edges = _neighborRowsGet(C, refresh, k)
+    dropped = [int(a) for a in appids[refresh]] + removed
+
+    connection = get_connection()
+    for part in _inChunks(dropped):
+        ph = ",".join("?" for _ in part)
+        connection.execute(f"DELETE FROM app_visual_neighbors WHERE appid IN ({ph})", tuple(part))
+    for part in _inChunks(removed):
+        ph = ",".join("?" for _ in part)
+        connection.execute(f"DELETE FROM app_visual_centroids WHERE appid IN ({ph})", tuple(part))
+
+    connection.executemany("INSERT INTO app_visual_neighbors (appid, rank, neighbor, score) VALUES (?, ?, ?, ?)", edges)
+    _centroidSnapshotWrite(connection, C, changedRows, timestamp(), k)
+    connection.commit()
+    connection.close()
+
+    return {"built": True, "changed": len(changedRows), "removed": len(removed), "refreshed": len(refresh), "k": k}
+
+def similarGet(appid: int, limit: int = SIM_K) -> list[dict] | None:
+    """
+    stored neighbours for one app (None if the app isnt in the graph)"""
+
+    rows = all_fetch(
+        """
+        SELECT n.neighbor AS appid, n.score AS score, ai.name AS name
+        FROM app_visual_neighbors n
+        LEFT JOIN app_index ai ON ai.appid = n.neighbor
+        WHERE n.appid = ?
+        ORDER BY n.rank ASC
+        LIMIT ?
+        """,
+        (appid, limit)
+    )
+
+    if not rows and not single_fetch("SELECT 1 AS ok FROM app_visual_centroids WHERE appid = ?", (appid,)):
+        return None
+
+    return [{"appid": int(r["appid"]), "name": r["name"], "score": float(r["score"])} for r in rows]
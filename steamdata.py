@@ -1,18 +1,37 @@
 import json
 import os
+import zlib
+import asyncio
+from collections import OrderedDict
 from dotenv import load_dotenv
 import httpx
 
-from db import single_fetch, exec, timestamp
+from db import single_fetch, all_fetch, exec, timestamp, get_connection, appLabelsWrite
+from appmeta import appMetaInvalidate
+from httpclient import httpGet
+from ratelimit import AdaptiveRateLimiter, retryAfterParse
 
 load_dotenv()
 
 steam_api_key = os.getenv("STEAM_API_KEY", "")
 
+# >> overridable so a local stand-in (catalog.py serve) can replace steam <<
+STEAM_API_BASE = os.getenv("STEAM_API_BASE", "https://api.steampowered.com").rstrip("/")
+STEAM_STORE_BASE = os.getenv("STEAM_STORE_BASE", "https://store.steampowered.com").rstrip("/")
+
+# >> shared budget for store appdetails calls (default 4/s ~ the old 240 req/min sleep) <<
+storeLimiter = AdaptiveRateLimiter(
+    rate = float(os.getenv("STORE_RATE", "4")),
+    burst = int(os.getenv("STORE_BURST", "8")),
+    minRate = float(os.getenv("STORE_MIN_RATE", "0.25")),
+    increase = float(os.getenv("STORE_RATE_INCREASE", "0.1")),
+)
+STORE_RETRIES = int(os.getenv("STORE_RETRIES", "3"))
+
 ## >>> fetch info from steam api; returned as list of dicts. <<<
 async def f_owned(steamid64: str) -> list[dict]:
 
-    url = "https://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/"
+    url = f"{STEAM_API_BASE}/IPlayerService/GetOwnedGames/v0001/"
 
     params = {
     "key": steam_api_key,
@@ -22,49 +41,316 @@ async def f_owned(steamid64: str) -> list[dict]:
     "format": "json",
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+    response = await httpGet(url, params=params)
+    response.raise_for_status()
+    data = response.json()
 
     return data.get("response", {}).get("games", []) or []
 
+# >>> only what the app reads from appdetails is kept.
+# APPDETAILS_FIELDS -> top level keys kept ("*" keeps everything)
+# APPDETAILS_FILTERS -> steam's own `filters` param so less comes over the wire ("" to disable)
+# list fields are trimmed to the sub keys in _DETAIL_SUBFIELDS. <<<
+APPDETAILS_FIELDS = [f.strip() for f in os.getenv("APPDETAILS_FIELDS", "type,name,steam_appid,genres,categories,screenshots").split(",") if f.strip()]
+APPDETAILS_FILTERS = os.getenv("APPDETAILS_FILTERS", "basic,genres,categories,screenshots")
+
+_DETAIL_SUBFIELDS = {
+    "genres": ("id", "description"),
+    "categories": ("id", "description"),
+    "screenshots": ("id", "path_full"),
+}
+
+def detailsProject(data: dict) -> dict:
+    if "*" in APPDETAILS_FIELDS:
+        return data
+
+    out = {}
+
+    for k in APPDETAILS_FIELDS:
+        if k not in data:
+            continue
+
+        v = data[k]
+        sub = _DETAIL_SUBFIELDS.get(k)
+        if sub and isinstance(v, list):
+            v = [{sk: i[sk] for sk in sub if sk in i} for i in v if isinstance(i, dict)]
+
+        out[k] = v
+
+    return out
+
+# >> stored as zlib compressed compact json (BLOB). rows written before this
+# are plain json TEXT; both are read, appdetailsCompact rewrites the old ones <<
+def detailsEncode(data: dict) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 6)
+
+def detailsDecode(raw: bytes | str) -> dict:
+    if isinstance(raw, bytes):
+        return json.loads(zlib.decompress(raw))
+    return json.loads(raw)
+
 # >>> calls steam store "appdetails" endpoint;
 # returns metadata JSON. <<<
 async def f_appdetails_store(appid: int) -> dict | None:
 
-    url = "https://store.steampowered.com/api/appdetails"
+    url = f"{STEAM_STORE_BASE}/api/appdetails"
     params = {
         "appids": str(appid),
         "l": "english", # >> forces english for langauge metadata <<
     }
+    if APPDETAILS_FILTERS:
+        params["filters"] = APPDETAILS_FILTERS
+
+    # >> charged per network attempt; 429 / 5xx back the whole process off <<
+    for attempt in range(STORE_RETRIES + 1):
+        await storeLimiter.acquire()
+        response = await httpGet(url, params=params)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            storeLimiter.throttle(retryAfterParse(response.headers.get("Retry-After"), storeLimiter.defaultPause))
+            if attempt < STORE_RETRIES:
+                continue
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(url, params=params)
         response.raise_for_status()
-        appdata = response.json()
+        storeLimiter.success()
+        break
+
+    appdata = response.json()
 
     app_entry = appdata.get(str(appid), {})
 
     if not app_entry.get("success"):
         return None
-    
-    return app_entry.get("data")
+
+    # >> steam sends [] instead of {} when a filtered request has nothing left <<
+    data = app_entry.get("data")
+    if not isinstance(data, dict):
+        return None
+
+    return detailsProject(data)
+
+# >> appid -> the store fetch currently running for it <<
+_appdetailsInflight: dict[int, asyncio.Task] = {}
+
+def _inflightDrop(appid: int, task: asyncio.Task) -> None:
+    if _appdetailsInflight.get(appid) is task:
+        del _appdetailsInflight[appid]
+
+    # >> background refreshes may have nobody awaiting them; mark errors as seen <<
+    if not task.cancelled():
+        task.exception()
+
+def fetchInflight(appid: int) -> bool:
+    return appid in _appdetailsInflight
+
+def _fetchShared(appid: int, current_time: int) -> asyncio.Task:
+    """
+    single-flight: concurrent misses for one appid share a fetch + write"""
+
+    task = _appdetailsInflight.get(appid)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.create_task(_appdetails_fetch_write(appid, current_time))
+        _appdetailsInflight[appid] = task
+        task.add_done_callback(lambda t: _inflightDrop(appid, t))
+
+    return task
+
+# >>> parsed appdetails kept in memory: appid -> (details, fetched_at).
+# lru bounded by APPDETAILS_CACHE_SIZE; age is checked against the callers
+# ttl_seconds on every hit, same as the sqlite row. treat entries as read only. <<<
+APPDETAILS_CACHE_SIZE = int(os.getenv("APPDETAILS_CACHE_SIZE", "4096"))
+
+_detailsCache: OrderedDict[int, tuple[dict, int]] = OrderedDict()
+_detailsCacheStats = {"hits": 0, "misses": 0, "stale": 0, "revalidations": 0, "expired": 0, "evicted": 0}
+
+def _detailsCachePut(appid: int, data: dict, fetchedAt: int) -> None:
+    _detailsCache[appid] = (data, fetchedAt)
+    _detailsCache.move_to_end(appid)
+
+    while len(_detailsCache) > APPDETAILS_CACHE_SIZE:
+        _detailsCache.popitem(last = False)
+        _detailsCacheStats["evicted"] += 1
+
+def detailsCacheInvalidate(appid: int | None = None) -> None:
+    if appid is None:
+        _detailsCache.clear()
+    else:
+        _detailsCache.pop(appid, None)
+
+def detailsCacheStats() -> dict:
+    lookups = _detailsCacheStats["hits"] + _detailsCacheStats["stale"] + _detailsCacheStats["misses"]
+    return {
+        **_detailsCacheStats,
+        "size": len(_detailsCache),
+        "max_size": APPDETAILS_CACHE_SIZE,
+        "hit_rate": round(_detailsCacheStats["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+# >>> negative cache: failed lookups are remembered in [app_details_failures]
+# so dead appids dont go back to steam on every call. permanent failures
+# (success: false) and transient ones (429 / 5xx / network) expire separately. <<<
+APPDETAILS_FAIL_TTL = int(os.getenv("APPDETAILS_FAIL_TTL", str(60 * 60 * 24)))
+APPDETAILS_TRANSIENT_TTL = int(os.getenv("APPDETAILS_TRANSIENT_TTL", str(60 * 10)))
+
+def _failureFresh(transient: int, failedAt: int, now: int) -> bool:
+    return now - failedAt < (APPDETAILS_TRANSIENT_TTL if transient else APPDETAILS_FAIL_TTL)
+
+def failureRecord(appid: int, reason: str, transient: bool) -> None:
+    exec(
+        """
+        INSERT INTO app_details_failures (appid, reason, transient, attempts, failed_at)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(appid) DO UPDATE SET
+            reason = excluded.reason,
+            transient = excluded.transient,
+            attempts = attempts + 1,
+            failed_at = excluded.failed_at
+        """,
+        (appid, reason, int(transient), timestamp())
+    )
+
+def knownBadAppidsGet(appids: list[int]) -> set[int]:
+    """
+    appids with a failure that hasnt expired yet (skip without a network call)"""
+
+    ids = list(dict.fromkeys(int(a) for a in appids))
+    now = timestamp()
+    bad = set()
+
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        ph = ",".join("?" for _ in part)
+        rows = all_fetch(f"SELECT appid, transient, failed_at FROM app_details_failures WHERE appid IN ({ph})", tuple(part))
+        bad.update(int(r["appid"]) for r in rows if _failureFresh(r["transient"], r["failed_at"], now))
+
+    return bad
+
+def _failureClassify(e: Exception) -> tuple[str, bool]:
+    """
+    (reason, transient) for an exception from the store call"""
+
+    if isinstance(e, httpx.HTTPStatusError):
+        code = e.response.status_code
+        return f"http {code}", code == 429 or code >= 500
+    if isinstance(e, httpx.HTTPError):
+        return type(e).__name__, True
+    return f"bad response: {type(e).__name__}", True
+
+# >>> stale-while-revalidate: an expired row is served as is and a refresh
+# is queued in the background (through the same single-flight + storeLimiter).
+# reads are counted so the scheduler in refresher.py can refresh hot apps first. <<<
+APPDETAILS_TTL = 60 * 60 * 24 * 7
+APPDETAILS_SWR = os.getenv("APPDETAILS_SWR", "1") not in ("0", "false", "off")
+APPDETAILS_SWR_MAX_PENDING = int(os.getenv("APPDETAILS_SWR_MAX_PENDING", "256"))
+
+_readCounts: dict[int, int] = {}
+
+def _revalidateQueue(appid: int) -> None:
+    # >> past the cap the scheduler picks it up instead <<
+    if appid in _appdetailsInflight or len(_appdetailsInflight) >= APPDETAILS_SWR_MAX_PENDING:
+        return
+
+    # >> delisted apps keep their old row; dont go back to the store until the failure expires <<
+    if knownBadAppidsGet([appid]):
+        return
+
+    _detailsCacheStats["revalidations"] += 1
+    _fetchShared(appid, timestamp())
+
+def readCountsFlush() -> int:
+    """
+    add the in-memory read counts onto [app_details].reads"""
+
+    if not _readCounts:
+        return 0
+
+    counts = list(_readCounts.items())
+    _readCounts.clear()
+
+    connection = get_connection()
+    connection.executemany("UPDATE app_details SET reads = reads + ? WHERE appid = ?", [(n, a) for a, n in counts])
+    connection.commit()
+    connection.close()
+
+    return len(counts)
 
 # >>> basically ensures data is up to date. <<<
-async def f_appdetails_cached(appid: int, ttl_seconds: int = 60 * 60 * 24 * 7, forceRef = False) -> dict | None: # >>> ttl_seconds -> cached data lifespan <<<
+async def f_appdetails_cached(appid: int, ttl_seconds: int = APPDETAILS_TTL, forceRef = False, staleOk: bool | None = None) -> dict | None: # >>> ttl_seconds -> cached data lifespan <<<
 
-    r = single_fetch("SELECT json, fetched_at FROM app_details WHERE appid = ?", [appid])
     current_time = timestamp()
+    staleOk = APPDETAILS_SWR if staleOk is None else staleOk
+    expired = None    # >> json of an expired row; served if steam fails transiently <<
+
+    if not forceRef:
+        _readCounts[appid] = _readCounts.get(appid, 0) + 1
+        hit = _detailsCache.get(appid)
+
+        if hit and current_time - hit[1] < ttl_seconds:
+            _detailsCache.move_to_end(appid)
+            _detailsCacheStats["hits"] += 1
+            return hit[0]
 
-    if r and not forceRef:
-        data_age = current_time - r["fetched_at"]
-        if data_age < ttl_seconds:
-            return json.loads(r["json"])
+        if hit and staleOk:
+            _detailsCache.move_to_end(appid)
+            _detailsCacheStats["stale"] += 1
+            _revalidateQueue(appid)
+            return hit[0]
+
+        _detailsCacheStats["misses"] += 1
+        if hit:
+            _detailsCacheStats["expired"] += 1
+
+        r = single_fetch(
+            """
+            SELECT d.json, d.fetched_at, f.transient, f.failed_at
+            FROM (SELECT ? AS appid) k
+            LEFT JOIN app_details d ON d.appid = k.appid
+            LEFT JOIN app_details_failures f ON f.appid = k.appid
+            """,
+            [appid]
+        )
+
+        if r["json"] is not None:
+            data_age = current_time - r["fetched_at"]
+            if data_age < ttl_seconds or staleOk:
+                data = detailsDecode(r["json"])
+                _detailsCachePut(appid, data, r["fetched_at"])
+
+                if data_age >= ttl_seconds:
+                    _detailsCacheStats["stale"] += 1
+                    _revalidateQueue(appid)
+
+                return data
+
+            expired = r["json"]
+
+        # >> known bad + not expired -> no network call.
+        # a transient failure only hides the app when theres no older row to fall back on <<
+        if r["failed_at"] is not None and _failureFresh(r["transient"], r["failed_at"], current_time):
+            return detailsDecode(expired) if expired is not None and r["transient"] else None
+    else:
+        detailsCacheInvalidate(appid)
+
+    # >> shielded so one caller giving up doesnt cancel the fetch for the rest <<
+    try:
+        return await asyncio.shield(_fetchShared(appid, current_time))
+    except (httpx.HTTPError, ValueError) as e:
+        if expired is None or not _failureClassify(e)[1]:
+            raise
+        return detailsDecode(expired)
+
+async def _appdetails_fetch_write(appid: int, current_time: int) -> dict | None:
+    try:
+        data = await f_appdetails_store(appid)
+    except (httpx.HTTPError, ValueError) as e:
+        failureRecord(appid, *_failureClassify(e))
+        raise
 
-    data = await f_appdetails_store(appid)
     if data is None:
+        failureRecord(appid, "unavailable (success: false)", False)
         return None
+
+    exec("DELETE FROM app_details_failures WHERE appid = ?", (appid,))
     UpsertAppIndex(appid, data)
     SSUpsert(appid, data)
 
@@ -74,13 +360,41 @@ async def f_appdetails_cached(appid: int, ttl_seconds: int = 60 * 60 * 24 * 7, f
         VALUES (?, ?, ?)
         ON CONFLICT(appid) DO UPDATE SET
             json = excluded.json,
-            fetched_at = excluded.fetched_at
+            fetched_at = excluded.fetched_at,
+            reads = 0
         """,
-        [appid, json.dumps(data), current_time]
+        [appid, detailsEncode(data), current_time]
     )
+    _detailsCachePut(appid, data, current_time)
     
     return data
 
+# >>> many appids at once. cache hits come straight back; misses go through
+# storeLimiter with at most `concurrency` in flight.
+# yields (appid, details | None, error | None) in completion order. <<<
+async def f_appdetails_bulk(appids: list[int], concurrency: int = 8, ttl_seconds: int = APPDETAILS_TTL, forceRef = False):
+    pending = iter(appids)
+    out: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        for appid in pending:
+            try:
+                data = await f_appdetails_cached(appid, ttl_seconds=ttl_seconds, forceRef=forceRef)
+                await out.put((appid, data, None))
+            except Exception as e:
+                await out.put((appid, None, str(e) or type(e).__name__))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(appids))))]
+    done = asyncio.gather(*workers)
+
+    try:
+        for _ in range(len(appids)):
+            yield await out.get()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(done, return_exceptions=True)
+
 # >>> Extraction Helpers. <<<
 def ExtGenres(appdetails: dict) -> list[str]:
     genres = appdetails.get("genres") or []
@@ -97,7 +411,8 @@ def UpsertAppIndex(appid: int, appdetails: dict) -> None:
     categories = ExtCat(appdetails)
     ts = timestamp()
 
-    exec(
+    connection = get_connection()
+    connection.execute(
         """
         INSERT INTO app_index(appid, name, genres, categories, updated_at)
         VALUES(?,?,?,?,?)
@@ -115,6 +430,11 @@ def UpsertAppIndex(appid: int, appdetails: dict) -> None:
             ts,
         ),
     )
+    appLabelsWrite(connection, appid, genres, categories)
+    connection.commit()
+    connection.close()
+
+    appMetaInvalidate([appid])
 
 # >> cannot be asked taking my own screenshots so making an extracter for screenshots from steam store. <<<
 def ExtScreenshots(appdetails: dict) -> list[str]:
@@ -154,7 +474,7 @@ def cacheBackfill(appid: int) -> dict:
             "after_rows": 0,
         }
     
-    data = json.loads(row["json"])
+    data = detailsDecode(row["json"])
     
     before = single_fetch(
         "SELECT COUNT(*) as cnt FROM app_screenshots WHERE appid = ?",
@@ -174,4 +494,73 @@ def cacheBackfill(appid: int) -> dict:
         "added_rows": after - before,
         "before_rows": before,
         "after_rows": after,
-    }
\ No newline at end of file
+    }
+
+def appdetailsCompact(batch: int = 500, vacuum: bool = False) -> dict:
+    """
+    rewrite plain json rows as projected + compressed blobs, in place.
+    safe to rerun; VACUUM afterwards gives the freed pages back to the os.
+    rows that dont parse are left alone and counted"""
+
+    from db import db_path
+
+    sizeBefore = db_path.stat().st_size if db_path.exists() else 0
+    rewritten = 0
+    undecodable = 0
+    bytesBefore = 0
+    bytesAfter = 0
+    lastAppid = -1
+
+    connection = get_connection()
+
+    while True:
+        rows = connection.execute(
+            """
+            SELECT appid, json FROM app_details
+            WHERE typeof(json) = 'text' AND appid > ?
+            ORDER BY appid
+            LIMIT ?
+            """,
+            (lastAppid, batch)
+        ).fetchall()
+
+        if not rows:
+            break
+
+        lastAppid = int(rows[-1]["appid"])
+        updates = []
+
+        for r in rows:
+            try:
+                blob = detailsEncode(detailsProject(json.loads(r["json"])))
+            except (ValueError, TypeError, AttributeError):
+                undecodable += 1
+                continue
+
+            bytesBefore += len(r["json"].encode("utf-8"))
+            bytesAfter += len(blob)
+            updates.append((blob, int(r["appid"])))
+
+        # >> typeof check again: a fresh blob written since the SELECT (refresher / swr) wins <<
+        cursor = connection.executemany(
+            "UPDATE app_details SET json = ? WHERE appid = ? AND typeof(json) = 'text'",
+            updates
+        )
+        connection.commit()
+        rewritten += cursor.rowcount
+
+    if vacuum:
+        connection.execute("VACUUM")
+
+    connection.close()
+    detailsCacheInvalidate()
+
+    return {
+        "rewritten": rewritten,
+        "undecodable": undecodable,
+        "payload_bytes_before": bytesBefore,
+        "payload_bytes_after": bytesAfter,
+        "db_bytes_before": sizeBefore,
+        "db_bytes_after": db_path.stat().st_size if db_path.exists() else 0,
+        "vacuumed": vacuum,
+    }
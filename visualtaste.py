@@ -0,0 +1,161 @@
+import math
+import numpy as np
+
+from db import all_fetch, single_fetch, exec, timestamp
+from clip import appCentroidMatrixGet, f32toBytes, bytesToF32, normVec
+
+# >>> per user visual taste vector.
+# playtime weighted (log1p) mean of the screenshot centroids of the users
+# top played games. stored in [user_visual_taste] and rebuilt on sync;
+# /rec?mode=visual ranks the catalogue by cosine to it. <<<
+
+TASTE_TOP_N = 50
+
+_tasteCache: dict[str, dict] = {}
+
+def _lastSyncedGet(steamid64: str) -> int | None:
+    """
+    when the users library last changed (users.owned_changed_at; libraries
+    synced before that column existed fall back to owned_games)"""
+
+    row = single_fetch(
+        """
+        SELECT COALESCE(
+            (SELECT owned_changed_at FROM users WHERE steamid64 = ?),
+            (SELECT MAX(last_synced) FROM owned_games WHERE steamid64 = ?)
+        ) AS last_synced
+        """,
+        (steamid64, steamid64)
+    )
+    return row["last_synced"] if row else None
+
+def _topGamesGet(steamid64: str, TopGames_n: int = TASTE_TOP_N) -> list:
+    return all_fetch(
+        """
+        SELECT appid, name, pt_forever_min
+        FROM owned_games
+        WHERE steamid64 = ? AND pt_forever_min > 0
+        ORDER BY pt_forever_min DESC
+        LIMIT ?
+        """,
+        (steamid64, TopGames_n)
+    )
+
+def _centroidRowsGet(C: dict, appids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (mask of appids that have a centroid, their row in C)"""
+
+    if not len(C["appids"]):
+        return np.zeros(len(appids), dtype=bool), np.zeros(0, dtype=np.int64)
+
+    pos = np.minimum(np.searchsorted(C["appids"], appids), len(C["appids"]) - 1)
+    found = C["appids"][pos] == appids
+    return found, pos[found]
+
+def userVisualTasteBuild(steamid64: str, TopGames_n: int = TASTE_TOP_N) -> np.ndarray | None:
+    """
+    (re)build + store the users taste vector. None if none of their
+    top games have screenshot embeddings yet"""
+
+    lastSynced = _lastSyncedGet(steamid64)
+    rows = _topGamesGet(steamid64, TopGames_n)
+
+    C = appCentroidMatrixGet()
+    appids = np.array([int(r["appid"]) for r in rows], dtype=np.int64)
+    w = np.array([math.log1p(int(r["pt_forever_min"])) for r in rows], dtype=np.float64)
+
+    found, pos = _centroidRowsGet(C, appids)
+    vec = None
+
+    if found.any():
+        wf = w[found]
+        vec = normVec(((wf[:, None] * C["centroids"][pos]).sum(axis = 0) / wf.sum()).astype(np.float32))
+
+        exec(
+            """
+            INSERT INTO user_visual_taste (steamid64, embedding, dim, app_count, last_synced, built_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(steamid64) DO UPDATE SET
+                embedding = excluded.embedding,
+                dim = excluded.dim,
+                app_count = excluded.app_count,
+                last_synced = excluded.last_synced,
+                built_at = excluded.built_at
+            """,
+            (steamid64, f32toBytes(vec), int(len(vec)), int(found.sum()), lastSynced, timestamp())
+        )
+    else:
+        exec("DELETE FROM user_visual_taste WHERE steamid64 = ?", (steamid64,))
+
+    # >> "no embeddings yet" isnt cached; the next read tries again once screenshots are embedded <<
+    if vec is None:
+        _tasteCache.pop(steamid64, None)
+    else:
+        _tasteCache[steamid64] = {"last_synced": lastSynced, "vec": vec}
+    return vec
+
+def userVisualTasteGet(steamid64: str) -> np.ndarray | None:
+    """
+    memory -> [user_visual_taste] -> rebuild, keyed on the users last sync"""
+
+    lastSynced = _lastSyncedGet(steamid64)
+
+    hit = _tasteCache.get(steamid64)
+    if hit and hit["last_synced"] == lastSynced:
+        return hit["vec"]
+
+    row = single_fetch(
+        "SELECT embedding, dim, last_synced FROM user_visual_taste WHERE steamid64 = ?",
+        (steamid64,)
+    )
+
+    if row and row["last_synced"] == lastSynced:
+        vec = bytesToF32(row["embedding"], int(row["dim"]))
+        _tasteCache[steamid64] = {"last_synced": lastSynced, "vec": vec}
+        return vec
+
+    return userVisualTasteBuild(steamid64)
+
+def visualRecsGet(steamid64: str, exclude: set[int] | None = None, k: int = 20) -> list[dict]:
+    """
+    rank every app with embeddings by cosine to the users taste vector.
+    one matrix-vector product; reasons name the closest of the users top games"""
+
+    vec = userVisualTasteGet(steamid64)
+    C = appCentroidMatrixGet()
+
+    if vec is None or not len(C["appids"]) or C["centroids"].shape[1] != len(vec):
+        return []
+
+    scores = (C["centroids"] @ vec).astype(np.float64)
+
+    if exclude:
+        scores[np.isin(C["appids"], np.fromiter(exclude, dtype=np.int64))] = -np.inf
+
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return []
+
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.lexsort((top, -scores[top]))]
+
+    # >> which of the users own games each result looks most like <<
+    rows = _topGamesGet(steamid64)
+    found, pos = _centroidRowsGet(C, np.array([int(r["appid"]) for r in rows], dtype=np.int64))
+    names = [r["name"] or str(r["appid"]) for r, f in zip(rows, found) if f]
+    closest = (C["centroids"][top] @ C["centroids"][pos].T).argmax(axis = 1) if len(pos) else None
+
+    results = []
+
+    for n, i in enumerate(top):
+        reasons = []
+        if closest is not None:
+            reasons.append(f"Looks like {names[closest[n]]}")
+
+        results.append({
+            "appid": int(C["appids"][i]),
+            "Score": float(scores[i]),
+            "Reasons": reasons,
+        })
+
+    return results